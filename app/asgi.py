@@ -0,0 +1,190 @@
+"""ASGI bridge that serves the Flask app from an event loop.
+
+Connections are owned by the event loop, so idle keep-alive clients and
+slow uploads cost no thread. A request body is read asynchronously; only
+then does the Flask view run on a bounded thread pool, where blocking model
+calls and file writes happen. Requests beyond the pool size wait on the
+loop instead of on a worker.
+
+A WSGI response is a blocking iterator, so the pool thread that runs a view
+also hands its response to the loop chunk by chunk and waits for each send.
+A streamed response (SSE, NDJSON; anything without Content-Length) therefore
+holds one pool thread until it ends, including while a slow client drains
+it. At most ``IMMA_ASGI_MAX_STREAMS`` streams are open at once, so the other
+threads stay free for regular requests; further streams get 503.
+
+Usage::
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 3
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -c gunicorn.conf.py
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+logger = logging.getLogger(__name__)
+
+ASGI_THREADS = int(os.environ.get("IMMA_ASGI_THREADS", "32"))
+ASGI_MAX_STREAMS = int(os.environ.get("IMMA_ASGI_MAX_STREAMS", str(max(1, ASGI_THREADS // 2))))
+MAX_MEMORY_BODY = 1024 * 1024
+
+
+class _ClientGone(Exception):
+    pass
+
+
+class WsgiBridge:
+    """ASGI application running a WSGI app on a bounded thread pool."""
+
+    def __init__(self, wsgi_app, max_threads=ASGI_THREADS, max_streams=ASGI_MAX_STREAMS):
+        self.wsgi_app = wsgi_app
+        self.max_threads = max_threads
+        self.max_streams = min(max_streams, max_threads)
+        self._streams = threading.BoundedSemaphore(self.max_streams)
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_threads, thread_name_prefix='asgi')
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError('unsupported ASGI scope type %r' % scope['type'])
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    # Let in-flight requests finish their writes.
+                    await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        with SpooledTemporaryFile(max_size=MAX_MEMORY_BODY) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._run, scope, body, loop, send)
+
+    def _run(self, scope, body, loop, send):
+        """Runs on a pool thread; hands each ASGI message to the loop and waits for it."""
+        def push(message):
+            try:
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+            except Exception as exc:
+                raise _ClientGone() from exc
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers],
+            }
+
+        result = self.wsgi_app(_environ(scope, body), start_response)
+        # A response without Content-Length is a stream and keeps this thread until it ends.
+        streaming = not any(k == b'content-length' for k, _ in started['message']['headers'])
+        if streaming and not self._streams.acquire(blocking=False):
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+            logger.warning('Rejected a streamed response: %d streams already open', self.max_streams)
+            try:
+                push({'type': 'http.response.start', 'status': 503,
+                      'headers': [(b'content-type', b'application/json'), (b'retry-after', b'1')]})
+                push({'type': 'http.response.body',
+                      'body': json.dumps({'status': 'error', 'error': 'too many open streams'}).encode('utf-8')})
+            except _ClientGone:
+                pass
+            return
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started.get('sent'):
+                    started['sent'] = True
+                    push(started['message'])
+                push({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not started.get('sent'):
+                started['sent'] = True
+                push(started['message'])
+            push({'type': 'http.response.body', 'body': b''})
+        except _ClientGone:
+            logger.info('Client disconnected before the response finished')
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+            if streaming:
+                self._streams.release()
+
+
+def _environ(scope, body):
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin1')
+    path_info = scope['path'].encode('utf-8').decode('latin1')
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    headers = defaultdict(list)
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        headers[key].append(value.decode('latin1'))
+    for key, values in headers.items():
+        environ[key] = ','.join(values)
+    return environ
+
+
+def create_asgi_app(max_threads=ASGI_THREADS, max_streams=ASGI_MAX_STREAMS):
+    from . import create_app
+
+    return WsgiBridge(create_app(), max_threads=max_threads, max_streams=max_streams)
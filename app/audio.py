@@ -0,0 +1,261 @@
+"""Streaming prosodic features for voice uploads.
+
+An upload is spooled to a temporary file and analyzed in a process pool, so
+the CPU-heavy work never runs on a request thread. The worker reads the file
+in ``soundfile`` blocks and folds each block into running statistics, so
+memory stays flat however long the recording is.
+
+Features come from non-overlapping 40 ms frames of the mono mixdown:
+
+- energy: RMS in dBFS (mean and spread over non-silent frames, peak);
+- pitch: autocorrelation F0 of voiced frames, 75-400 Hz;
+- speaking rate: voiced runs of at least 80 ms (roughly syllable nuclei)
+  per second; articulation rate counts only non-silent seconds.
+
+``IMMA_AUDIO_WORKERS=0`` analyzes in the calling thread instead.
+"""
+import os
+import math
+import atexit
+import functools
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+logger = logging.getLogger(__name__)
+
+AUDIO_WORKERS = int(os.environ.get('IMMA_AUDIO_WORKERS', '2'))
+AUDIO_TIMEOUT_S = float(os.environ.get('IMMA_AUDIO_TIMEOUT_S', '120'))
+AUDIO_MAX_BYTES = int(float(os.environ.get('IMMA_AUDIO_MAX_MB', '200')) * 1024 * 1024)
+
+FRAME_S = 0.04
+BLOCK_FRAMES = 50           # 2 s of audio per soundfile block
+F0_MIN, F0_MAX = 75.0, 400.0
+SILENCE_DB = -45.0
+VOICING_THRESHOLD = 0.45    # normalized autocorrelation peak
+MIN_SYLLABLE_FRAMES = 2
+
+
+class Unavailable(RuntimeError):
+    """soundfile is not installed."""
+
+
+class DecodeError(ValueError):
+    """The upload is not audio that libsndfile can read."""
+
+
+class ProsodyAccumulator:
+    """Running energy, pitch and speaking-rate statistics over mono frames."""
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.frame_len = max(1, int(round(FRAME_S * sample_rate)))
+        self.min_lag = max(1, int(sample_rate / F0_MAX))
+        self.max_lag = min(self.frame_len - 1, int(sample_rate / F0_MIN))
+        self.frames = 0
+        self.speech_frames = 0
+        self.energy_sum = 0.0
+        self.energy_sq = 0.0
+        self.energy_max = -math.inf
+        self.voiced_frames = 0
+        self.f0_sum = 0.0
+        self.f0_sq = 0.0
+        self.f0_min = math.inf
+        self.f0_max = -math.inf
+        self.syllables = 0
+        self._run = 0
+
+    def update(self, samples):
+        """Adds a block of mono samples; a trailing partial frame is ignored."""
+        n = len(samples) // self.frame_len
+        if n == 0:
+            return
+        frames = np.asarray(samples[:n * self.frame_len], dtype=np.float64).reshape(n, self.frame_len)
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        db = 20.0 * np.log10(rms + 1e-10)
+        speech = db > SILENCE_DB
+
+        self.frames += n
+        self.energy_max = max(self.energy_max, float(db.max()))
+        speech_db = db[speech]
+        self.speech_frames += len(speech_db)
+        self.energy_sum += float(speech_db.sum())
+        self.energy_sq += float((speech_db * speech_db).sum())
+
+        voiced = np.zeros(n, dtype=bool)
+        if self.max_lag > self.min_lag and speech.any():
+            # Autocorrelation of every frame at once via a zero-padded FFT.
+            spectrum = np.fft.rfft(frames[speech], n=2 * self.frame_len, axis=1)
+            ac = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, axis=1)[:, :self.max_lag + 1]
+            window = ac[:, self.min_lag:] / np.maximum(ac[:, :1], 1e-12)
+            peak = window.argmax(axis=1)
+            strength = window[np.arange(len(peak)), peak]
+            is_voiced = strength > VOICING_THRESHOLD
+            voiced[speech] = is_voiced
+            f0 = self.sample_rate / (self.min_lag + peak[is_voiced])
+            if len(f0):
+                self.voiced_frames += len(f0)
+                self.f0_sum += float(f0.sum())
+                self.f0_sq += float((f0 * f0).sum())
+                self.f0_min = min(self.f0_min, float(f0.min()))
+                self.f0_max = max(self.f0_max, float(f0.max()))
+
+        # A voiced run counts once, when it reaches MIN_SYLLABLE_FRAMES;
+        # runs continue across blocks.
+        run = self._run
+        for v in voiced.tolist():
+            if v:
+                run += 1
+                if run == MIN_SYLLABLE_FRAMES:
+                    self.syllables += 1
+            else:
+                run = 0
+        self._run = run
+
+    def result(self):
+        frame_s = self.frame_len / self.sample_rate
+        speech_s = self.speech_frames * frame_s
+        features = {
+            'energy': None,
+            'pitch': None,
+            'voiced_ratio': _round(self.voiced_frames / self.frames) if self.frames else 0.0,
+            'pause_ratio': _round(1 - self.speech_frames / self.frames) if self.frames else 1.0,
+            'speaking_rate': _round(self.syllables / (self.frames * frame_s)) if self.frames else 0.0,
+            'articulation_rate': _round(self.syllables / speech_s) if speech_s else 0.0,
+        }
+        if self.speech_frames:
+            mean, std = _mean_std(self.energy_sum, self.energy_sq, self.speech_frames)
+            features['energy'] = {'mean_db': _round(mean), 'std_db': _round(std), 'max_db': _round(self.energy_max)}
+        if self.voiced_frames:
+            mean, std = _mean_std(self.f0_sum, self.f0_sq, self.voiced_frames)
+            features['pitch'] = {'mean_hz': _round(mean), 'std_hz': _round(std),
+                                 'min_hz': _round(self.f0_min), 'max_hz': _round(self.f0_max)}
+        return features
+
+
+def _mean_std(total, squares, count):
+    mean = total / count
+    return mean, math.sqrt(max(squares / count - mean * mean, 0.0))
+
+
+def _round(value):
+    return round(float(value), 3)
+
+
+def analyze_file(path):
+    """Prosodic features of an audio file, read block by block."""
+    if sf is None:
+        raise Unavailable('soundfile is not installed')
+    try:
+        with sf.SoundFile(path) as fh:
+            acc = ProsodyAccumulator(fh.samplerate)
+            for block in fh.blocks(blocksize=acc.frame_len * BLOCK_FRAMES, dtype='float32', always_2d=True):
+                acc.update(block.mean(axis=1) if block.shape[1] > 1 else block[:, 0])
+            features = acc.result()
+            features.update({
+                'duration_s': _round(fh.frames / fh.samplerate),
+                'sample_rate': fh.samplerate,
+                'channels': fh.channels,
+                'format': fh.format,
+            })
+    except getattr(sf, 'LibsndfileError', RuntimeError) as e:
+        # LibsndfileError does not pickle back from the pool.
+        raise DecodeError(str(e)) from None
+    return features
+
+
+# --- process pool --------------------------------------------------------------
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    # One pool per worker process; a forked gunicorn worker must not reuse its parent's.
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # forkserver: never fork a process that is running request threads.
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(AUDIO_WORKERS, mp_context=multiprocessing.get_context(method))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _analyze_and_remove(path):
+    try:
+        return analyze_file(path)
+    finally:
+        _remove(path)
+
+
+def _remove_if_not_run(path, future):
+    # A cancelled job never started, and a broken pool killed its worker
+    # before the job's own cleanup ran.
+    if future.cancelled() or isinstance(future.exception(), BrokenProcessPool):
+        _remove(path)
+
+
+def analyze(path, timeout=AUDIO_TIMEOUT_S):
+    """Runs analyze_file in the process pool and waits up to ``timeout`` seconds.
+
+    Takes ownership of ``path``: the file is removed when the job is done
+    with it. After a timeout a queued job is cancelled; one that is already
+    running finishes and removes the file itself.
+    """
+    global _pool
+    if sf is None:
+        _remove(path)
+        raise Unavailable('soundfile is not installed')
+    if AUDIO_WORKERS <= 0:
+        return _analyze_and_remove(path)
+    pool = _get_pool()
+    try:
+        future = pool.submit(_analyze_and_remove, path)
+    except BaseException:
+        _remove(path)
+        raise
+    future.add_done_callback(functools.partial(_remove_if_not_run, path))
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+    except BrokenProcessPool:
+        logger.exception('Audio worker pool broke; it will be restarted')
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+def shutdown():
+    """Stops the pool's worker processes (gunicorn worker_exit)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_pid == os.getpid():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown)
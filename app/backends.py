@@ -0,0 +1,255 @@
+"""CPU inference backends for the sentiment model.
+
+``IMMA_INFERENCE_BACKEND`` selects one of:
+
+- ``torch``       fp32 PyTorch model (the original path)
+- ``torch-int8``  PyTorch with dynamic int8 quantization of Linear layers
+- ``onnx``        ONNX Runtime on an exported fp32 graph
+- ``onnx-int8``   ONNX Runtime on a dynamically quantized graph
+
+The ONNX backends need the artifacts written by the export command. The
+compare command runs every backend in a fresh process on the same texts. It
+reports latency and RSS and fails if any backend's probabilities drift from
+fp32 by more than ``--max-drift``::
+
+    python -m app.backends export --out models/arabert
+    python -m app.backends compare --artifacts models/arabert --max-drift 0.05
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import importlib
+import subprocess
+
+import numpy as np
+
+BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+ONNX_FILES = {'onnx': 'model.onnx', 'onnx-int8': 'model.int8.onnx'}
+NUM_LABELS = 5
+MAX_LENGTH = 512
+
+# Read here rather than in ml.py so the CLI (and every _measure subprocess)
+# runs without importing ml, whose analyzer starts loading a model.
+MODEL_NAME = os.environ.get("IMMA_MODEL_NAME", "aubmindlab/bert-base-arabertv2")
+MODEL_ARTIFACTS_DIR = os.environ.get(
+    "IMMA_MODEL_ARTIFACTS", os.path.join(os.path.dirname(__file__), "..", "models", "arabert")
+)
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class TorchBackend:
+    """PyTorch model, optionally with dynamic int8 quantization."""
+
+    def __init__(self, model_name, quantize=False, device='cpu'):
+        torch = importlib.import_module('torch')
+        transformers = importlib.import_module('transformers')
+        self.name = 'torch-int8' if quantize else 'torch'
+        self._torch = torch
+        self.device = device
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
+        model = transformers.AutoModelForSequenceClassification.from_pretrained(model_name, num_labels=NUM_LABELS)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model.to(device)
+
+    def forward(self, input_ids, attention_mask):
+        """Probabilities for already padded int arrays of shape (batch, seq)."""
+        torch = self._torch
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=torch.as_tensor(input_ids, device=self.device),
+                attention_mask=torch.as_tensor(attention_mask, device=self.device),
+            )
+        logits = getattr(outputs, 'logits', None)
+        if logits is None:
+            raise ValueError("model returned no logits")
+        return torch.softmax(logits, dim=1).cpu().numpy()
+
+    def predict(self, texts):
+        enc = self.tokenizer(list(texts), max_length=MAX_LENGTH, padding='longest',
+                             truncation=True, return_tensors='np')
+        return self.forward(enc['input_ids'], enc['attention_mask'])
+
+
+class OnnxBackend:
+    """ONNX Runtime session over an exported graph."""
+
+    def __init__(self, artifacts_dir, quantized=False, threads=None):
+        ort = importlib.import_module('onnxruntime')
+        transformers = importlib.import_module('transformers')
+        self.name = 'onnx-int8' if quantized else 'onnx'
+        path = os.path.join(artifacts_dir, ONNX_FILES[self.name])
+        if not os.path.exists(path):
+            raise FileNotFoundError('%s not found; run "python -m app.backends export" first' % path)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(artifacts_dir)
+
+    def forward(self, input_ids, attention_mask):
+        logits = self.session.run(['logits'], {
+            'input_ids': np.asarray(input_ids, dtype=np.int64),
+            'attention_mask': np.asarray(attention_mask, dtype=np.int64),
+        })[0]
+        return _softmax(logits)
+
+    def predict(self, texts):
+        enc = self.tokenizer(list(texts), max_length=MAX_LENGTH, padding='longest',
+                             truncation=True, return_tensors='np')
+        return self.forward(enc['input_ids'], enc['attention_mask'])
+
+
+def load_backend(name, model_name, artifacts_dir=None, device='cpu'):
+    """Builds the backend selected by ``name`` (one of BACKENDS)."""
+    if name == 'torch':
+        return TorchBackend(model_name, device=device)
+    if name == 'torch-int8':
+        # Dynamic quantization only targets CPU kernels.
+        return TorchBackend(model_name, quantize=True, device='cpu')
+    if name in ONNX_FILES:
+        return OnnxBackend(artifacts_dir or model_name, quantized=(name == 'onnx-int8'))
+    raise ValueError('unknown inference backend %r (expected one of %s)' % (name, ', '.join(BACKENDS)))
+
+
+def export(model_name, out_dir, opset=14):
+    """Writes tokenizer files, model.onnx and model.int8.onnx to ``out_dir``."""
+    torch = importlib.import_module('torch')
+    quantization = importlib.import_module('onnxruntime.quantization')
+    backend = TorchBackend(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    backend.tokenizer.save_pretrained(out_dir)
+
+    sample = backend.tokenizer(['مرحبا'], return_tensors='pt')
+    fp32_path = os.path.join(out_dir, ONNX_FILES['onnx'])
+    dynamic = {0: 'batch', 1: 'sequence'}
+    torch.onnx.export(
+        backend.model,
+        (sample['input_ids'], sample['attention_mask']),
+        fp32_path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={'input_ids': dynamic, 'attention_mask': dynamic, 'logits': {0: 'batch'}},
+        opset_version=opset,
+    )
+    quantization.quantize_dynamic(fp32_path, os.path.join(out_dir, ONNX_FILES['onnx-int8']),
+                                  weight_type=quantization.QuantType.QInt8)
+    return out_dir
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _measure(name, model_name, artifacts_dir, texts, batch_size, rounds):
+    """Runs in a fresh process so RSS reflects this backend alone."""
+    backend = load_backend(name, model_name, artifacts_dir)
+    probs = np.concatenate([backend.predict(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+    timings = []
+    for _ in range(rounds):
+        for i in range(0, len(texts), batch_size):
+            start = time.perf_counter()
+            backend.predict(texts[i:i + batch_size])
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'backend': name,
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'rss_mb': _rss_mb(),
+        'probabilities': probs.tolist(),
+    }
+
+
+def compare(model_name, artifacts_dir, texts, backends=BACKENDS, batch_size=8, rounds=3, max_drift=0.05):
+    """Measures every backend and checks its drift against fp32 torch.
+
+    Drift is the largest absolute probability difference; label agreement is
+    the share of texts with the same argmax. Returns (reports, ok).
+    """
+    reports = []
+    for name in backends:
+        cmd = [sys.executable, '-m', 'app.backends', '_measure', '--backend', name,
+               '--model', model_name, '--batch-size', str(batch_size), '--rounds', str(rounds)]
+        if artifacts_dir:
+            cmd += ['--artifacts', artifacts_dir]
+        proc = subprocess.run(cmd, input=json.dumps(texts, ensure_ascii=False), capture_output=True,
+                              text=True, encoding='utf-8')
+        if proc.returncode != 0:
+            reports.append({'backend': name, 'error': proc.stderr.strip().splitlines()[-1:]})
+            continue
+        reports.append(json.loads(proc.stdout))
+
+    reference = next((r for r in reports if r['backend'] == 'torch' and 'error' not in r), None)
+    ok = reference is not None
+    for report in reports:
+        if 'error' in report or reference is None:
+            continue
+        ref = np.asarray(reference['probabilities'])
+        got = np.asarray(report.pop('probabilities'))
+        report['max_drift'] = float(np.abs(ref - got).max())
+        report['label_agreement'] = float((ref.argmax(axis=1) == got.argmax(axis=1)).mean())
+        ok = ok and report['max_drift'] <= max_drift
+    if reference is not None:
+        reference.pop('probabilities', None)
+    return reports, ok
+
+
+def _default_texts(limit=500):
+    from . import services, interaction_log
+
+    entries = interaction_log.iter_entries(services.INTERACTION_LOG_DIR, legacy_path=services.INTERACTION_LOG_PATH)
+    texts = list(itertools.islice((e['input'] for e in entries if e.get('input')), limit))
+    return texts or ['انا حزينة', 'مرحبا', 'أنا متوتر من العمل']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sentiment model inference backends.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help='Export ONNX (fp32 and int8) artifacts.')
+    exp.add_argument('--model', default=MODEL_NAME)
+    exp.add_argument('--out', default=MODEL_ARTIFACTS_DIR)
+    cmp_ = sub.add_parser('compare', help='Latency, RSS and fp32 parity for each backend.')
+    cmp_.add_argument('--model', default=MODEL_NAME)
+    cmp_.add_argument('--artifacts', default=MODEL_ARTIFACTS_DIR)
+    cmp_.add_argument('--backends', default=','.join(BACKENDS))
+    cmp_.add_argument('--max-drift', type=float, default=0.05)
+    cmp_.add_argument('--batch-size', type=int, default=8)
+    cmp_.add_argument('--rounds', type=int, default=3)
+    meas = sub.add_parser('_measure')
+    meas.add_argument('--backend', required=True)
+    meas.add_argument('--model', required=True)
+    meas.add_argument('--artifacts', default=None)
+    meas.add_argument('--batch-size', type=int, default=8)
+    meas.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        print('Wrote artifacts to %s' % export(args.model, args.out))
+    elif args.command == '_measure':
+        texts = json.loads(sys.stdin.read())
+        print(json.dumps(_measure(args.backend, args.model, args.artifacts, texts, args.batch_size, args.rounds)))
+    elif args.command == 'compare':
+        reports, ok = compare(args.model, args.artifacts, _default_texts(), args.backends.split(','),
+                              args.batch_size, args.rounds, args.max_drift)
+        print(json.dumps(reports, indent=2))
+        if not ok:
+            print('Parity check failed (max drift %.3f)' % args.max_drift, file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""In-memory cache for the read-only JSON content files.
+
+Every lookup calls ``os.stat``; the file is re-parsed only when its mtime or
+size changed. Each cached version carries an ETag and a Last-Modified time.
+It also memoizes values derived from the parsed data, such as serialized
+response bodies or indexes, so those are built once per file version.
+
+Parsed data is shared between requests and must be treated as read-only.
+"""
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ContentEntry:
+    """One version of one file."""
+
+    __slots__ = ('path', 'version', 'data', 'etag', 'mtime', '_derived', '_lock')
+
+    def __init__(self, path, version, data):
+        self.path = path
+        self.version = version
+        self.data = data
+        # Same stat on the same file gives the same ETag in every worker.
+        self.etag = '%x-%x' % version if version else None
+        self.mtime = version[0] / 1e9 if version else None
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def derived(self, key, fn):
+        """Returns ``fn(data)``, computed once for this version of the file."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = fn(self.data)
+            return self._derived[key]
+
+
+class ContentCache:
+    """Path -> ContentEntry, revalidated against the file's mtime and size."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, path, default):
+        try:
+            st = os.stat(path)
+            version = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            version = None
+        entry = self._entries.get(path)
+        if entry is not None and entry.version == version:
+            self.hits += 1
+            return entry
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.version != version:
+                entry = ContentEntry(path, version, self._load(path, default) if version else default)
+                self._entries[path] = entry
+                self.loads += 1
+            return entry
+
+    @staticmethod
+    def _load(path, default):
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except (json.JSONDecodeError, OSError):
+            # Cached like a good version, so a broken file is not re-parsed on every request.
+            logger.exception('Failed to load or parse JSON file: %s', path)
+            return default
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
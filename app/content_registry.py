@@ -0,0 +1,110 @@
+"""Hot-reloadable content built from a JSON file.
+
+A ContentRegistry holds the object that ``build(data, version)`` made from
+the file's current contents, for example responses plus the matchers and
+indexes derived from them. ``current`` is a plain attribute read. Readers
+take it once and use that snapshot for the whole request, so they never see
+half of an update.
+
+A watcher thread polls the file's mtime and size every ``poll_interval``
+seconds. When they change, it parses and builds the new snapshot on its own
+thread, then swaps the reference in one assignment. A file that fails to
+parse or build is logged and skipped; the previous snapshot stays live.
+"""
+import os
+import json
+import time
+import logging
+import threading
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RELOADS = metrics.counter('imma_content_reloads_total',
+                                  'Content file reloads by file and result (ok, error).', ('file', 'result'))
+
+
+class ContentRegistry:
+    """Current build of one JSON file, rebuilt off-thread when the file changes."""
+
+    def __init__(self, path, build, default=None, poll_interval=2.0):
+        self.path = path
+        self.build = build
+        self.default = default if default is not None else {}
+        self.poll_interval = poll_interval
+        self.current = None
+        self.version = 0
+        self.loaded_at = None
+        self._source = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def load(self):
+        """Initial synchronous build; falls back to ``default`` if the file cannot be used."""
+        if not self.reload(force=True):
+            with self._lock:
+                if self.current is None:
+                    self._swap(self.default, self._source)
+        return self.current
+
+    def reload(self, force=False):
+        """Rebuilds if the file changed since the last attempt. Returns True if a new snapshot is live."""
+        with self._lock:
+            source = self._stat()
+            if not force and source == self._source:
+                return False
+            # Remember the attempt, so a broken file is not re-parsed every poll.
+            self._source = source
+            name = os.path.basename(self.path)
+            try:
+                with open(self.path, 'r', encoding='utf-8') as fh:
+                    data = json.load(fh)
+                self._swap(data, source)
+            except Exception:
+                logger.exception('Failed to reload %s; keeping version %d', self.path, self.version)
+                CONTENT_RELOADS.inc(name, 'error')
+                return False
+            CONTENT_RELOADS.inc(name, 'ok')
+            return True
+
+    def publish(self, data):
+        """Builds and swaps in ``data`` directly (tests and reload hooks)."""
+        with self._lock:
+            self._swap(data, self._source)
+        return self.current
+
+    def _swap(self, data, source):
+        start = time.perf_counter()
+        built = self.build(data, self.version + 1)
+        self.version += 1
+        self.current = built
+        self.loaded_at = time.time()
+        logger.info('Loaded %s as content version %d in %.1f ms', self.path, self.version,
+                    (time.perf_counter() - start) * 1000)
+
+    def ensure_started(self):
+        """Starts the watcher once per process (cheap to call per request)."""
+        if self.poll_interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._watch, name='content-watcher', daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except Exception:
+                logger.exception('Content watcher failed for %s', self.path)
@@ -0,0 +1,139 @@
+"""Fuzzy phrase lookup equivalent to ``difflib.get_close_matches(n=1)``.
+
+get_close_matches only accepts a candidate whose ``real_quick_ratio`` (length
+bound) and ``quick_ratio`` (character multiset overlap) reach the cutoff, so
+both are hard filters:
+
+1. Keys outside the admissible length range are never touched (postings are
+   sorted by key length).
+2. Each string becomes a set of ``(char, occurrence)`` tokens sorted by global
+   rarity. Two strings can only reach the required overlap if their
+   rare-token prefixes intersect (prefix filtering), so only the postings of
+   the query's prefix tokens are read.
+3. The exact multiset overlap of the surviving keys is computed in one
+   vectorized step against a per-key character count matrix.
+
+Only keys passing all three are rescored with ``SequenceMatcher.ratio``.
+"""
+import numpy as np
+from collections import Counter
+from difflib import SequenceMatcher
+
+
+def _tokens(text):
+    seen = Counter()
+    out = []
+    for ch in text:
+        seen[ch] += 1
+        out.append((ch, seen[ch]))
+    return out
+
+
+class PhraseIndex:
+    """Immutable index over phrase keys for n=1 close-match lookup."""
+
+    def __init__(self, keys, cutoff=0.6):
+        self.cutoff = cutoff
+        self.keys = tuple(keys)
+        self._has_empty = '' in self.keys
+        self._overlap = {}
+        token_lists = [_tokens(k) for k in self.keys]
+        self._df = Counter(t for tokens in token_lists for t in set(tokens))
+
+        self._columns = {ch: i for i, ch in enumerate(sorted({ch for k in self.keys for ch in k}))}
+        self._counts = np.zeros((len(self.keys), max(1, len(self._columns))), dtype=np.uint16)
+        self._lengths = np.array([len(k) for k in self.keys], dtype=np.int64)
+
+        postings = {}
+        for key_id, tokens in enumerate(token_lists):
+            if not tokens:
+                continue
+            for ch, n in Counter(self.keys[key_id]).items():
+                self._counts[key_id, self._columns[ch]] = n
+            length = len(tokens)
+            # Longest prefix any partner could need: the smallest total length.
+            total = length + self._length_range(length)[0]
+            prefix = length - self._min_overlap(total) + 1
+            for pos, token in enumerate(sorted(tokens, key=self._order)[:prefix]):
+                postings.setdefault(token, []).append((length, pos, key_id))
+        self._postings = {}
+        for token, entries in postings.items():
+            entries.sort()
+            self._postings[token] = tuple(np.array(col, dtype=np.int64) for col in zip(*entries))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _order(self, token):
+        return (self._df.get(token, 0), token)
+
+    def _min_overlap(self, total):
+        """Smallest overlap I with ``2*I/total >= cutoff``, computed as difflib does."""
+        overlap = self._overlap.get(total)
+        if overlap is None:
+            overlap = max(0, int(self.cutoff * total / 2.0) - 1)
+            while 2.0 * overlap / total < self.cutoff:
+                overlap += 1
+            self._overlap[total] = overlap
+        return overlap
+
+    def _length_range(self, length):
+        """Partner lengths passing difflib's real_quick_ratio check."""
+        lo = max(1, int(length * self.cutoff / (2.0 - self.cutoff)) - 1)
+        while 2.0 * min(length, lo) / (length + lo) < self.cutoff:
+            lo += 1
+        hi = int(length * (2.0 - self.cutoff) / self.cutoff) + 2
+        while 2.0 * min(length, hi) / (length + hi) < self.cutoff:
+            hi -= 1
+        return lo, hi
+
+    def candidates(self, query):
+        """Ids of keys whose length and character overlap pass difflib's quick checks."""
+        tokens = sorted(_tokens(query), key=self._order)
+        length = len(tokens)
+        if not length or not self._postings:
+            return np.empty(0, dtype=np.int64)
+        lo, hi = self._length_range(length)
+        need = np.array([self._min_overlap(length + n) for n in range(lo, hi + 1)], dtype=np.int64)
+        prefix = length - int(need[0]) + 1
+
+        found = []
+        for i, token in enumerate(tokens[:prefix]):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            lengths, positions, ids = posting
+            start = np.searchsorted(lengths, lo, side='left')
+            stop = np.searchsorted(lengths, hi, side='right')
+            if start >= stop:
+                continue
+            lengths, positions, ids = lengths[start:stop], positions[start:stop], ids[start:stop]
+            pair_need = need[lengths - lo]
+            keep = (i <= length - pair_need) & (positions <= lengths - pair_need)
+            found.append(ids[keep])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        ids = np.unique(np.concatenate(found))
+
+        query_counts = np.zeros(self._counts.shape[1], dtype=np.uint16)
+        for ch, n in Counter(query).items():
+            col = self._columns.get(ch)
+            if col is not None:
+                query_counts[col] = n
+        overlap = np.minimum(self._counts[ids], query_counts).sum(axis=1, dtype=np.int64)
+        return ids[2.0 * overlap / (self._lengths[ids] + length) >= self.cutoff]
+
+    def best(self, query):
+        """Returns the key ``get_close_matches(query, keys, n=1, cutoff)`` would."""
+        if not query:
+            return '' if self._has_empty else None
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        best = None
+        for key_id in self.candidates(query).tolist():
+            key = self.keys[key_id]
+            matcher.set_seq1(key)
+            score = matcher.ratio()
+            if score >= self.cutoff and (best is None or (score, key) > best):
+                best = (score, key)
+        return best[1] if best else None
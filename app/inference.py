@@ -0,0 +1,117 @@
+"""In-process dynamic micro-batching for model inference.
+
+Concurrent request threads submit single inputs. One worker thread groups
+them into batches of at most ``max_batch_size``, waiting at most
+``max_wait_ms`` for a batch to fill, and runs the batch function once per
+batch. Callers wait up to their own latency budget and can fall back if it
+runs out.
+"""
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceTimeout(Exception):
+    """Raised when a result is not ready within the caller's budget."""
+
+
+class MicroBatcher:
+    """Collects single requests into batches for ``batch_fn(inputs) -> outputs``."""
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5, max_queue=1024, name='inference'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='%s-batcher' % name, daemon=True)
+        self._thread.start()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Queues one input and returns a Future for its output."""
+        future = Future()
+        if self._stopped.is_set():
+            future.set_exception(RuntimeError('batcher stopped'))
+            return future
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            future.set_exception(InferenceTimeout('inference queue full'))
+        return future
+
+    def infer(self, item, timeout=None):
+        """Submits one input and waits up to ``timeout`` seconds for its output."""
+        future = self.submit(item)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise InferenceTimeout('inference exceeded %.0f ms' % (timeout * 1000))
+
+    def infer_many(self, items, timeout=None):
+        """Submits several inputs and waits up to ``timeout`` seconds for all of them.
+
+        Bulk callers should pass chunks of a few batches so live requests
+        can still interleave with them in the queue.
+        """
+        futures = [self.submit(item) for item in items]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            return [f.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                    for f in futures]
+        except FutureTimeout:
+            for f in futures:
+                f.cancel()
+            raise InferenceTimeout('inference exceeded %.0f ms' % (timeout * 1000))
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if batch is None:
+                break
+            # Skip requests whose callers already gave up.
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                outputs = self.batch_fn([item for item, _ in batch])
+            except Exception as exc:
+                logger.exception('Batch inference failed')
+                for _, fut in batch:
+                    fut.set_exception(exc)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), output in zip(batch, outputs):
+                fut.set_result(output)
+
+    def close(self):
+        self._stopped.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
@@ -0,0 +1,274 @@
+"""Append-only interaction log stored as JSON Lines segments.
+
+Each writer process appends to its own open segment (``*.jsonl.open``) so
+gunicorn workers never interleave or race on rotation. A segment is sealed
+(renamed to ``*.jsonl``) once it grows past ``max_segment_bytes`` or when the
+writer closes. ``compact`` merges sealed segments and ``export`` rebuilds the
+legacy ``interaction_log.json`` array format.
+
+Usage::
+
+    python -m app.interaction_log export --out data/interaction_log.json
+    python -m app.interaction_log compact
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import argparse
+import threading
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.jsonl.open'
+SEALED_SUFFIX = '.jsonl'
+
+
+class InteractionLog:
+    """Constant-time appender for interaction entries.
+
+    Appends are fsynced in batches: after ``fsync_every`` entries, or once
+    ``fsync_interval`` seconds have passed since the last fsync. A timer
+    syncs a batch that stays below the threshold when no further write
+    comes, so no entry waits more than ``fsync_interval`` to reach disk.
+    """
+
+    def __init__(self, directory, max_segment_bytes=8 * 1024 * 1024,
+                 fsync_every=64, fsync_interval=1.0):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._fd = None
+        self._path = None
+        self._size = 0
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+        self._pid = None
+        self._timer = None
+        self._timer_pid = None
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._pid = os.getpid()
+        name = '%013d-%d%s' % (int(time.time() * 1000), self._pid, OPEN_SUFFIX)
+        self._path = os.path.join(self.directory, name)
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def _seal_segment(self):
+        if self._fd is None:
+            return
+        try:
+            os.fsync(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        sealed = self._path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX
+        os.replace(self._path, sealed)
+        self._path = None
+
+    def append(self, entry):
+        """Appends one entry as a single JSON line."""
+        self.append_many((entry,))
+
+    def append_many(self, entries):
+        """Appends entries with one write and at most one fsync."""
+        data = b''.join((json.dumps(e, ensure_ascii=False) + '\n').encode('utf-8') for e in entries)
+        if not data:
+            return
+        with self._lock:
+            # A forked worker must not keep writing into its parent's segment.
+            # Closing the inherited copy leaves the parent's descriptor open.
+            if self._fd is not None and self._pid != os.getpid():
+                try:
+                    os.close(self._fd)
+                except OSError:
+                    pass
+                self._fd = None
+                self._path = None
+            if self._fd is None:
+                self._open_segment()
+            os.write(self._fd, data)
+            self._size += len(data)
+            self._pending += len(entries)
+            now = time.monotonic()
+            if (self._pending >= self.fsync_every
+                    or now - self._last_fsync >= self.fsync_interval):
+                self._sync()
+            else:
+                self._arm_timer(now)
+            if self._size >= self.max_segment_bytes:
+                self._seal_segment()
+
+    def _sync(self):
+        if self._fd is not None and self._pending:
+            os.fsync(self._fd)
+            self._pending = 0
+            self._last_fsync = time.monotonic()
+
+    def _arm_timer(self, now):
+        # Threads do not survive fork, so a timer armed by the parent does not count.
+        if self._timer is not None and self._timer_pid == os.getpid():
+            return
+        delay = max(0.0, self._last_fsync + self.fsync_interval - now)
+        self._timer = threading.Timer(delay, self._timed_sync)
+        self._timer.daemon = True
+        self._timer_pid = os.getpid()
+        self._timer.start()
+
+    def _timed_sync(self):
+        with self._lock:
+            self._timer = None
+            if self._pid != os.getpid():
+                return
+            try:
+                self._sync()
+            except OSError:
+                logger.exception('Failed to fsync interaction log segment %s', self._path)
+
+    def flush(self):
+        """Forces buffered entries to disk."""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """Seals the current segment."""
+        with self._lock:
+            if self._timer is not None and self._timer_pid == os.getpid():
+                self._timer.cancel()
+            self._timer = None
+            if self._pid == os.getpid():
+                self._seal_segment()
+
+
+def list_segments(directory, include_open=True):
+    """Returns segment paths in write order."""
+    if not os.path.isdir(directory):
+        return []
+    names = [n for n in os.listdir(directory)
+             if n.endswith(SEALED_SUFFIX) or (include_open and n.endswith(OPEN_SUFFIX))]
+    return [os.path.join(directory, n) for n in sorted(names)]
+
+
+def iter_segment(path):
+    """Yields the entries of one segment, skipping a torn trailing line."""
+    with open(path, 'r', encoding='utf-8') as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning('Skipping malformed line in %s', path)
+
+
+def iter_entries(directory, legacy_path=None):
+    """Yields legacy array entries followed by every segment entry, oldest first."""
+    if legacy_path and os.path.exists(legacy_path):
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as fh:
+                legacy = json.load(fh)
+        except json.JSONDecodeError:
+            logger.exception('Failed to parse legacy interaction log: %s', legacy_path)
+            legacy = []
+        for entry in legacy:
+            yield entry
+    entries = []
+    for path in list_segments(directory):
+        entries.extend(iter_segment(path))
+    # Segments from different workers overlap in time.
+    entries.sort(key=lambda e: e.get('timestamp') or '')
+    for entry in entries:
+        yield entry
+
+
+def compact(directory, target_bytes=64 * 1024 * 1024):
+    """Merges sealed segments into fewer, larger ones. Returns the number merged."""
+    sealed = list_segments(directory, include_open=False)
+    if len(sealed) < 2:
+        return 0
+    merged = 0
+    batch, batch_size = [], 0
+    for path in sealed + [None]:
+        size = os.path.getsize(path) if path else 0
+        if path is None or (batch and batch_size + size > target_bytes):
+            if len(batch) > 1:
+                _merge(batch)
+                merged += len(batch)
+            batch, batch_size = [], 0
+        if path:
+            batch.append(path)
+            batch_size += size
+    return merged
+
+
+def _merge(paths):
+    entries = []
+    for path in paths:
+        entries.extend(iter_segment(path))
+    entries.sort(key=lambda e: e.get('timestamp') or '')
+    # Keep the first segment's name so ordering against other segments holds.
+    target = paths[0]
+    tmp = target + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        for entry in entries:
+            fh.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, target)
+    for path in paths[1:]:
+        os.remove(path)
+
+
+def export(directory, out_path, legacy_path=None):
+    """Writes every entry as a single JSON array (the legacy format)."""
+    entries = list(iter_entries(directory, legacy_path))
+    tmp = out_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(entries, fh, ensure_ascii=False, indent=2)
+    os.replace(tmp, out_path)
+    return len(entries)
+
+
+def main(argv=None):
+    from . import services
+
+    parser = argparse.ArgumentParser(description='Interaction log maintenance.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    exp = sub.add_parser('export', help='Export all entries as a JSON array.')
+    exp.add_argument('--out', required=True)
+    exp.add_argument('--no-legacy', action='store_true',
+                     help='Do not include the legacy interaction_log.json entries.')
+    sub.add_parser('compact', help='Merge sealed segments.')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        legacy = None if args.no_legacy else services.INTERACTION_LOG_PATH
+        count = export(services.INTERACTION_LOG_DIR, args.out, legacy)
+        print('Exported %d entries to %s' % (count, args.out))
+    elif args.command == 'compact':
+        print('Merged %d segments' % compact(services.INTERACTION_LOG_DIR))
+
+
+_default_log = None
+_default_lock = threading.Lock()
+
+
+def get_log(directory):
+    """Returns the process-wide log for ``directory``, creating it on first use."""
+    global _default_log
+    with _default_lock:
+        if _default_log is None or _default_log.directory != directory:
+            _default_log = InteractionLog(directory)
+            atexit.register(_default_log.close)
+        return _default_log
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Precompiled emotion lexicon used by the fallback sentiment path."""
+import hashlib
+import itertools
+from types import MappingProxyType
+
+import numpy as np
+
+from . import utils, stemmer
+
+_versions = itertools.count(1)
+
+
+class LexiconIndex:
+    """Immutable stem -> (emotion, polarity) index.
+
+    Built once per lexicon version; swap in a new instance to reload.
+    ``fingerprint`` is a digest of the lexicon contents and the stemmer
+    profile, identical across worker processes that loaded the same lexicon.
+    """
+
+    __slots__ = ('version', 'fingerprint', 'entries', '_ids', '_emotions', '_polarity')
+
+    def __init__(self, polarity):
+        entries = {}
+        for emotion, value in polarity.items():
+            stem = stemmer.stem(utils.normalize_text(emotion))
+            if stem in entries:
+                # Keep the first emotion name and the last polarity, as the
+                # per-call dict rebuild used to.
+                entries[stem] = (entries[stem][0], value)
+            else:
+                entries[stem] = (emotion, value)
+        self.entries = MappingProxyType(entries)
+        # Dense arrays for score_many().
+        self._ids = {stem: i for i, stem in enumerate(entries)}
+        self._emotions = [emotion for emotion, _ in entries.values()]
+        self._polarity = np.array([value for _, value in entries.values()], dtype=np.float64)
+        self.version = next(_versions)
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(('stemmer=%s\x1f' % stemmer.PROFILE).encode('utf-8'))
+        for emotion, value in sorted(polarity.items()):
+            digest.update(('%s=%r\x1f' % (emotion, value)).encode('utf-8'))
+        self.fingerprint = digest.hexdigest()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, stem):
+        """Returns ``(emotion, polarity)`` or None."""
+        return self.entries.get(stem)
+
+    def score_many(self, docs, negations=()):
+        """Scores many token lists at once.
+
+        ``docs`` holds normalized words per text. Each distinct word is stemmed
+        once; matching and scoring run over flat NumPy arrays. A hit that
+        follows a word in ``negations`` counts -1.5x. Returns
+        ``(scores, emotions)`` where ``emotions[i]`` is the last matched
+        emotion of text ``i`` or None.
+        """
+        n = len(docs)
+        lengths = np.fromiter(map(len, docs), dtype=np.int64, count=n)
+        total = int(lengths.sum())
+        if total == 0 or not self._emotions:
+            return np.zeros(n), [None] * n
+
+        words = np.array([w for doc in docs for w in doc])
+        vocab, inverse = np.unique(words, return_inverse=True)
+        vocab_ids = np.fromiter((self._ids.get(s, -1) for s in stemmer.stem_many(vocab.tolist())),
+                                dtype=np.int64, count=len(vocab))
+        vocab_neg = np.fromiter((w in negations for w in vocab.tolist()), dtype=bool, count=len(vocab))
+        inverse = inverse.reshape(-1)
+        ids = vocab_ids[inverse]
+        doc_of = np.repeat(np.arange(n), lengths)
+
+        # Negation looks at the previous word of the same text only.
+        negated = np.zeros(total, dtype=bool)
+        negated[1:] = vocab_neg[inverse[:-1]]
+        starts = np.cumsum(lengths) - lengths
+        negated[starts[starts < total]] = False
+
+        polarity = np.where(ids >= 0, self._polarity[np.maximum(ids, 0)], 0.0)
+        hit = (ids >= 0) & (polarity != 0)
+        contrib = np.where(negated, -1.5 * polarity, polarity) * hit
+        scores = np.bincount(doc_of, weights=contrib, minlength=n)
+
+        last = np.full(n, -1, dtype=np.int64)
+        positions = np.flatnonzero(hit)
+        np.maximum.at(last, doc_of[positions], positions)
+        emotions = [self._emotions[ids[pos]] if pos >= 0 else None for pos in last.tolist()]
+        return scores, emotions
@@ -0,0 +1,97 @@
+"""Multi-pattern keyword matching (Aho-Corasick).
+
+One automaton holds every keyword list, grouped by category, and a single
+pass over the text reports every category hit with its offset. The cost of
+a scan depends on the text length and the number of hits, not on how many
+keywords are registered.
+"""
+import functools
+from collections import deque
+
+
+class Matches:
+    """Result of one scan: category -> [(offset, keyword), ...] in text order."""
+
+    __slots__ = ('hits',)
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    def __contains__(self, category):
+        return category in self.hits
+
+    def __bool__(self):
+        return bool(self.hits)
+
+    def first(self, categories):
+        """Returns the first of ``categories`` (in the given priority order) that was hit."""
+        for category in categories:
+            if category in self.hits:
+                return category
+        return None
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over ``{category: [keyword, ...]}``.
+
+    Categories keep their insertion order, which callers use as priority.
+    Repeated scans of the same text are served from a small LRU cache, so
+    several classifiers can share one scan of a message.
+    """
+
+    def __init__(self, groups, cache_size=1024):
+        self.categories = tuple(groups)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        patterns = {}
+        for category, keywords in groups.items():
+            for keyword in keywords:
+                if keyword:
+                    patterns.setdefault(keyword, []).append(category)
+        for keyword, categories in patterns.items():
+            self._add(keyword, tuple(categories))
+        self._build_failure_links()
+        self.size = len(patterns)
+        self.scan = functools.lru_cache(maxsize=cache_size)(self._scan)
+
+    def _add(self, keyword, categories):
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state] = self._out[state] + ((keyword, categories),)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _scan(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = {}
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for keyword, categories in out[state]:
+                    start = i - len(keyword) + 1
+                    for category in categories:
+                        hits.setdefault(category, []).append((start, keyword))
+        return Matches(hits)
@@ -0,0 +1,377 @@
+"""Counters and latency histograms with Prometheus text exposition.
+
+Recording is in-process and costs about a microsecond per timed span. When
+``IMMA_METRICS_DIR`` is set (gunicorn.conf.py sets it for its workers), each
+process writes a snapshot of its values to ``<dir>/<pid>-<start>.json``
+every ``IMMA_METRICS_FLUSH_S`` seconds. ``render()`` adds every process's
+snapshot to its own live values, so any worker can answer /metrics for the
+whole server. Other workers' values can be up to one flush interval old.
+
+Each worker holds an flock on ``<pid>-<start>.lock`` while it runs. A worker
+that exits folds its final values into ``exited.json``; one that died
+without doing so is folded from its last snapshot by the next render. So
+the directory holds one file per live worker plus one for all exited
+workers, and counters never go backwards.
+"""
+import os
+import json
+import time
+import atexit
+import contextlib
+import bisect
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not Unix: no cross-process snapshots
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get('IMMA_METRICS_DIR')
+FLUSH_INTERVAL = float(os.environ.get('IMMA_METRICS_FLUSH_S', '2'))
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    """Monotonic count per label tuple."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {_join(k): v for k, v in self._values.items()}
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+
+class Histogram:
+    """Bucketed observations per label tuple; stores [bucket counts..., +Inf count, sum]."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def time(self, *labels):
+        """Context manager that observes the elapsed seconds."""
+        return Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {_join(k): list(v) for k, v in self._values.items()}
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+
+class Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name, help, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def _join(labels):
+    return '\x1f'.join(labels)
+
+
+def _snapshot():
+    return {
+        name: {
+            'type': m.type,
+            'help': m.help,
+            'labelnames': list(m.labelnames),
+            'buckets': list(getattr(m, 'buckets', ())),
+            'samples': m.snapshot(),
+        }
+        for name, m in list(_registry.items())
+    }
+
+
+# --- cross-process snapshots -------------------------------------------------
+
+EXITED = 'exited'
+
+_writer_pid = None
+_writer_lock = threading.Lock()
+_worker_id = None
+_worker_lock_fd = None
+_retired = False
+
+
+def _shared():
+    """True once this process takes part in the cross-process snapshots."""
+    return _writer_pid == os.getpid()
+
+
+def _path(worker_id, ext='.json'):
+    return os.path.join(METRICS_DIR, worker_id + ext)
+
+
+@contextlib.contextmanager
+def _dir_lock():
+    """Serializes folding and reading snapshots across processes."""
+    fd = os.open(os.path.join(METRICS_DIR, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, families):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(families, fh)
+    os.replace(tmp, path)
+
+
+def _merge(families, other):
+    for name, family in other.items():
+        target = families.setdefault(name, dict(family, samples={}))
+        merge = Histogram.merge if family['type'] == 'histogram' else Counter.merge
+        for key, value in family['samples'].items():
+            target['samples'][key] = merge(target['samples'].get(key), value)
+    return families
+
+
+def write_snapshot():
+    """Writes this process's values for the other workers to read."""
+    if not _shared():
+        return
+    with _writer_lock:
+        if _retired:
+            return
+        try:
+            _write(_path(_worker_id), _snapshot())
+        except OSError:
+            logger.exception('Failed to write metrics snapshot for worker %s', _worker_id)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        write_snapshot()
+
+
+def ensure_started():
+    """Starts the snapshot writer once per process (cheap to call per request)."""
+    global _writer_pid, _worker_id, _worker_lock_fd, _retired
+    if _writer_pid == os.getpid() or not METRICS_DIR or fcntl is None:
+        return
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            # A reused pid gets a new id, so it never overwrites a dead worker's totals.
+            worker_id = '%d-%d' % (os.getpid(), time.time_ns())
+            fd = os.open(_path(worker_id, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            _worker_id, _worker_lock_fd, _retired = worker_id, fd, False
+            _writer_pid = os.getpid()
+            threading.Thread(target=_flush_loop, name='metrics-writer', daemon=True).start()
+            atexit.register(_retire)
+
+
+def _retire():
+    """Folds this worker's final values into the exited-workers snapshot (atexit)."""
+    global _retired
+    if not _shared():
+        return
+    with _writer_lock:
+        if _retired:
+            return
+        _retired = True
+        try:
+            with _dir_lock():
+                _fold(_snapshot())
+                _remove_worker(_worker_id)
+        except OSError:
+            logger.exception('Failed to fold metrics of worker %s', _worker_id)
+
+
+def _fold(families):
+    path = _path(EXITED)
+    _write(path, _merge(_read(path) or {}, families))
+
+
+def _remove_worker(worker_id):
+    for path in (_path(worker_id), _path(worker_id, '.json.tmp'), _path(worker_id, '.lock')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _alive(worker_id):
+    try:
+        fd = os.open(_path(worker_id, '.lock'), os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def _prune_exited():
+    """Folds snapshots of workers that died without retiring. Needs _dir_lock."""
+    worker_ids = set()
+    for entry in os.listdir(METRICS_DIR):
+        worker_id, ext = os.path.splitext(entry)
+        if ext in ('.json', '.lock') and worker_id not in (EXITED, _worker_id, ''):
+            worker_ids.add(worker_id)
+    for worker_id in worker_ids:
+        if _alive(worker_id):
+            continue
+        snapshot = _read(_path(worker_id))
+        if snapshot is not None:
+            _fold(snapshot)
+        _remove_worker(worker_id)
+
+
+def _collect():
+    """Merged {name: family} over this process (live) and every other snapshot."""
+    families = _snapshot()
+    if not _shared() or not os.path.isdir(METRICS_DIR):
+        return families
+    try:
+        # Folding and reading under one lock: an exited worker is counted exactly once.
+        with _dir_lock():
+            _prune_exited()
+            for entry in os.listdir(METRICS_DIR):
+                worker_id, ext = os.path.splitext(entry)
+                if ext != '.json' or worker_id == _worker_id:
+                    continue
+                other = _read(os.path.join(METRICS_DIR, entry))
+                if other is not None:
+                    _merge(families, other)
+    except OSError:
+        logger.exception('Failed to read metrics snapshots in %s', METRICS_DIR)
+    return families
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append('%s="%s"' % extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _fmt(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, family in sorted(_collect().items()):
+        names = family['labelnames']
+        lines.append('# HELP %s %s' % (name, family['help']))
+        lines.append('# TYPE %s %s' % (name, family['type']))
+        for key, value in sorted(family['samples'].items()):
+            values = key.split('\x1f') if names else []
+            if family['type'] == 'counter':
+                lines.append('%s%s %s' % (name, _labels(names, values), _fmt(value)))
+                continue
+            cumulative = 0
+            for bound, count in zip(family['buckets'], value):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, _labels(names, values, ('le', repr(float(bound)))), cumulative))
+            cumulative += value[len(family['buckets'])]
+            lines.append('%s_bucket%s %d' % (name, _labels(names, values, ('le', '+Inf')), cumulative))
+            lines.append('%s_sum%s %s' % (name, _labels(names, values), _fmt(value[-1])))
+            lines.append('%s_count%s %d' % (name, _labels(names, values), cumulative))
+    return '\n'.join(lines) + '\n'
+
+
+# --- metrics shared across modules -------------------------------------------
+
+REQUEST_SECONDS = histogram('imma_http_request_duration_seconds',
+                            'Time to build the response, by route, method and status.',
+                            ('route', 'method', 'status'))
+STAGE_SECONDS = histogram('imma_stage_duration_seconds',
+                          'Time spent in each chat pipeline stage.', ('stage',))
+SENTIMENT_SECONDS = histogram('imma_sentiment_duration_seconds',
+                              'analyze_sentiment latency by path (model, lexicon, model_fallback, cache).',
+                              ('path',))
+STORAGE_SECONDS = histogram('imma_storage_duration_seconds',
+                            'Storage operation latency (enqueue and background writes).', ('op',))
+STORAGE_ERRORS = counter('imma_storage_errors_total', 'Failed storage operations.', ('op',))
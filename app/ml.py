@@ -1,11 +1,24 @@
+import os
+import time
 import logging
+import threading
 import re
-import difflib
 import random
 import importlib
 import numpy as np
 from . import utils
 from . import services
+from . import lexicon
+from . import matcher
+from . import fuzzy
+from . import inference
+from . import model_server
+from . import backends
+from . import token_cache
+from . import result_cache
+from . import metrics
+from . import stemmer
+from . import content_registry
 
 # --- Conditional Imports for ML & Audio ---
 librosa = None
@@ -16,44 +29,79 @@ try:
 except ImportError:
     pass
 
+# torch/transformers are slow to import, so they are loaded by
+# import_ml_backend() from the model loading thread, not at module import.
 TORCH_AVAILABLE = False
 torch = None
-try:
-    if importlib.util.find_spec("torch") is not None:
-        torch = importlib.import_module("torch")
-        TORCH_AVAILABLE = True
-except Exception:
-    torch = None
-    TORCH_AVAILABLE = False
-
 AutoModelForSequenceClassification = None
 AutoTokenizer = None
-try:
-    if importlib.util.find_spec("transformers") is not None and TORCH_AVAILABLE:
-        mod = importlib.import_module("transformers")
-        AutoModelForSequenceClassification = getattr(mod, "AutoModelForSequenceClassification", None)
-        AutoTokenizer = getattr(mod, "AutoTokenizer", None)
-except ImportError:
-    pass
+device = "cpu"
+_backend_lock = threading.Lock()
+_backend_imported = False
+
+
+def import_ml_backend():
+    """Imports torch and transformers once, if installed."""
+    global TORCH_AVAILABLE, torch, AutoModelForSequenceClassification, AutoTokenizer, device, _backend_imported
+    with _backend_lock:
+        if _backend_imported:
+            return
+        _backend_imported = True
+        try:
+            if importlib.util.find_spec("torch") is not None:
+                torch = importlib.import_module("torch")
+                TORCH_AVAILABLE = True
+        except Exception:
+            torch = None
+            TORCH_AVAILABLE = False
+
+        try:
+            if importlib.util.find_spec("transformers") is not None and TORCH_AVAILABLE:
+                mod = importlib.import_module("transformers")
+                AutoModelForSequenceClassification = getattr(mod, "AutoModelForSequenceClassification", None)
+                AutoTokenizer = getattr(mod, "AutoTokenizer", None)
+        except ImportError:
+            pass
+
+        if TORCH_AVAILABLE and torch is not None:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # --- Global Config and Data ---
 logger = logging.getLogger(__name__)
 
-if TORCH_AVAILABLE and torch is not None:
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-else:
-    device = "cpu"
-
-# Load data from services
-responses_data = services.load_responses()
-GREETING_RESPONSES = responses_data.get("greetings", {})
-INTRO_RESPONSES = responses_data.get("intro", {})
-EMOTION_RESPONSES = responses_data.get("emotions", {})
-SPECIAL_RESPONSES = responses_data.get("special", {})
-MOTIVATIONAL_QUOTES = responses_data.get("motivational_quotes", [])
-PHRASE_BANK = responses_data.get("phrase_bank", {})
-YOUTH_RESOURCES = responses_data.get("youth_resources", {})
-THERAPEUTIC_INTERVENTIONS = responses_data.get("therapeutic_interventions", {})
+MODEL_NAME = backends.MODEL_NAME
+# One of backends.BACKENDS; the onnx backends read MODEL_ARTIFACTS_DIR
+INFERENCE_BACKEND = os.environ.get("IMMA_INFERENCE_BACKEND", "torch")
+MODEL_ARTIFACTS_DIR = backends.MODEL_ARTIFACTS_DIR
+# When set, workers use the shared model server on this Unix socket (see model_server.py)
+MODEL_SOCKET = os.environ.get("IMMA_MODEL_SOCKET")
+# Set by model_server.py in its own process, which builds its analyzer itself.
+MODEL_SERVER_PROCESS = os.environ.get("IMMA_MODEL_SERVER_PROCESS") == "1"
+# How often workers ping the shared model server; readiness follows the last ping.
+MODEL_PING_INTERVAL_S = float(os.environ.get("IMMA_MODEL_PING_S", "2"))
+
+# Micro-batching for transformer inference (see inference.py)
+BATCH_MAX_SIZE = int(os.environ.get("IMMA_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("IMMA_BATCH_MAX_WAIT_MS", "5"))
+INFERENCE_BUDGET_MS = float(os.environ.get("IMMA_INFERENCE_BUDGET_MS", "2000"))
+
+# Per-turn token id cache (see token_cache.py)
+TOKEN_CACHE_ENTRIES = int(os.environ.get("IMMA_TOKEN_CACHE_ENTRIES", "50000"))
+TOKEN_CACHE_MAX_TOKENS = int(os.environ.get("IMMA_TOKEN_CACHE_MAX_TOKENS", "5000000"))
+
+# Bulk analysis (analyze_many): inputs per model call and the time allowed for each.
+BULK_CHUNK_SIZE = int(os.environ.get("IMMA_BULK_CHUNK_SIZE", "64"))
+BULK_TIMEOUT_S = float(os.environ.get("IMMA_BULK_TIMEOUT_S", "120"))
+
+# Sentiment result cache (see result_cache.py); set IMMA_RESULT_CACHE_SHARED=1
+# to add a SQLite tier shared by all workers.
+RESULT_CACHE_SIZE = int(os.environ.get("IMMA_RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_TTL = float(os.environ.get("IMMA_RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_SHARED = os.environ.get("IMMA_RESULT_CACHE_SHARED", "") in ("1", "true")
+
+# responses.json is polled for changes every IMMA_CONTENT_POLL_S seconds and
+# rebuilt off-thread (see content_registry.py); 0 disables the watcher.
+CONTENT_POLL_S = float(os.environ.get("IMMA_CONTENT_POLL_S", "2"))
 
 # Constants from original file
 CRISIS_KEYWORDS = [
@@ -75,6 +123,17 @@ EMOTION_POLARITY = {
     "سيء": -0.7, "فاشل": -0.9, "مشكلة": -0.5, "صعب": -0.4,
 }
 
+NEGATION_WORDS = frozenset(("لا", "ليس", "لم", "لن", "غير", "ما"))
+
+
+def build_lexicon(responses=None):
+    """Builds the lexicon index from EMOTION_POLARITY plus any
+    ``emotion_polarity`` overrides in responses.json."""
+    polarity = dict(EMOTION_POLARITY)
+    polarity.update((responses or {}).get("emotion_polarity", {}))
+    return lexicon.LexiconIndex(polarity)
+
+
 # Topics and Keywords
 TOPIC_KEYWORDS = {
     "دراسة": ["دراسة", "مدرسة", "جامعة", "امتحان", "اختبار", "مذاكرة", "درجات", "معلم", "دكتور"],
@@ -118,10 +177,163 @@ TOPIC_RESPONSES = {
     ]
 }
 
+INTRO_KEYWORDS = {
+    # 1. Identity (Who are you?)
+    "self": ["من انت", "من أنت", "عرفني", "مين معي", "مين انت", "اسمك", "عرف عن نفسك", "شكون انت"],
+    # 2. Capabilities (What do you do?)
+    "capabilities": ["ماذا تفعل", "شو بتعمل", "وظيفتك", "فايدتك", "عملك", "ايش تسوي", "شنو دير", "تطبيق ايش", "فائدة التطبيق"],
+    # 3. Trust (Are you human? Privacy?)
+    "trust": ["روبوت", "انسان", "بشر", "آلة", "تخزين", "خصوصية", "سرية", "تفضحني", "حقيقي"],
+    # 4. General Small Talk (Openers)
+    "general_chat": ["نتعرف", "ندردش", "نسولف", "نتكلم", "احكي", "ملل", "زهقان", "طفشان", "ضايج"],
+}
+INTRO_DEFAULTS = {
+    "self": "أنا رفيقك الذكي.",
+    "capabilities": "أنا هنا لمساعدتك.",
+    "trust": "أنا هنا لأسمعك بسرية تامة.",
+    "general_chat": "أنا جاهز للحديث عن أي شيء!",
+}
+
+CONTINUATION_KEYWORDS = ["تابع", "كمل", "بعدين", "اكمل", "المزيد", "استمر", "ثم", "وبعدين", "شنو بعد"]
+
+# Worry themes for Phoenix insights, in priority order.
+PHOENIX_THEMES = [
+    (["فشل", "أفشل", "خسارة", "ما أنجح", "fail"],
+     "الفشل ليس نقيض النجاح، بل هو جزء منه. كل عثرة هي درس يقربك خطوة نحو هدفك."),
+    (["وحدة", "وحيد", "أحد", "lonely", "alone"],
+     "الوحدة فرصة لاكتشاف ذاتك ومصادقتها. أنت بصحبة نفسك، وهي صحبة تستحق التقدير."),
+    (["خوف", "خائف", "مرعوب", "fear", "scared"],
+     "الخوف مجرد ظل لشيء لم يحدث بعد. واجهه بالنور، وسيختفي."),
+    (["مستقبل", "بكرة", "غدا", "future"],
+     "المستقبل يُبنى بقرارات اليوم. ركز على لحظتك الحالية، فهي كل ما تملك."),
+    (["حب", "فراق", "تركني", "love", "breakup"],
+     "القلب الذي ينكسر يفسح مجالاً لنور جديد ليدخله. أنت تستحق الحب، ابدأ بحب نفسك."),
+    (["موت", "فقدان", "death", "loss"],
+     "الألم ثمن الحب. من نحبهم يتركون بصمة في أرواحنا لا تمحى، فهم يعيشون فينا."),
+]
+
+# Sentiment label -> core "emotions" responses key, in priority order.
+CORE_EMOTION_KEYWORDS = {
+    "سعيد": ["سعيد", "مبسوط", "فرحان", "متفائل", "رائع", "ممتاز", "جميل", "مذهل", "سعيدة", "مبسوطة", "فرحانة"],
+    "حزين": ["حزين", "مكتئب", "متضايق", "محبط", "يأس", "سيء", "فاشل", "مشكلة", "صعب", "حزن", "حزينة", "مكتئبة", "متضايقة", "وحيدة"],
+    "غاضب": ["غاضب", "عصبي", "مستفز", "غاضبة", "عصبية"],
+    "قلق": ["قلق", "متوتر", "خايف", "خائف", "قلقة", "متوترة", "خائفة"],
+    "وحدة": ["وحدة", "وحيد"],
+    "تعبان": ["تعبان", "مرهق"],
+}
+
+# Keyword categories, each a (group, name) pair. Group order inside a
+# matcher does not matter; callers pick the winner in their own priority order.
+OVERRIDE_CATEGORIES = [("override", t) for t in TOPIC_OVERRIDE_KEYWORDS]
+TOPIC_CATEGORIES = [("topic", t) for t in TOPIC_KEYWORDS]
+INTRO_CATEGORIES = [("intro", k) for k in INTRO_KEYWORDS]
+PHOENIX_CATEGORIES = [("phoenix", i) for i in range(len(PHOENIX_THEMES))]
+CRISIS_CATEGORY = ("crisis", None)
+CONTINUATION_CATEGORY = ("continuation", None)
+
+
+def build_message_matcher():
+    """Automaton over the lowercased message (override, topic, crisis, intro, phoenix)."""
+    groups = {}
+    groups.update((c, TOPIC_OVERRIDE_KEYWORDS[c[1]]) for c in OVERRIDE_CATEGORIES)
+    groups.update((c, TOPIC_KEYWORDS[c[1]]) for c in TOPIC_CATEGORIES)
+    groups[CRISIS_CATEGORY] = CRISIS_KEYWORDS
+    groups.update((c, INTRO_KEYWORDS[c[1]]) for c in INTRO_CATEGORIES)
+    groups.update((c, PHOENIX_THEMES[c[1]][0]) for c in PHOENIX_CATEGORIES)
+    return matcher.KeywordMatcher(groups)
+
+
+def build_normalized_matcher(greeting_categories):
+    """Automaton over normalize_text() output (greetings, continuation)."""
+    groups = {c: [c[1]] for c in greeting_categories}
+    groups[CONTINUATION_CATEGORY] = CONTINUATION_KEYWORDS
+    return matcher.KeywordMatcher(groups)
+
+
+def build_phrase_index(phrase_bank):
+    """Close-match index over phrase bank keys (difflib cutoff 0.6)."""
+    keys = phrase_bank.keys() if isinstance(phrase_bank, dict) else ()
+    return fuzzy.PhraseIndex(keys, cutoff=0.6)
+
+
+class ResponseContent:
+    """One version of responses.json plus the matchers and indexes built from it.
+
+    Treat as immutable: a reload builds a new instance and swaps it in.
+    """
+
+    __slots__ = ('version', 'greetings', 'intro', 'emotions', 'special', 'motivational_quotes', 'phrase_bank',
+                 'youth_resources', 'therapeutic_interventions', 'greeting_categories', 'normalized_matcher',
+                 'phrase_index', 'lexicon')
+
+    def __init__(self, responses, version=0):
+        self.version = version
+        self.greetings = responses.get("greetings", {})
+        self.intro = responses.get("intro", {})
+        self.emotions = responses.get("emotions", {})
+        self.special = responses.get("special", {})
+        self.motivational_quotes = responses.get("motivational_quotes", [])
+        self.phrase_bank = responses.get("phrase_bank", {})
+        self.youth_resources = responses.get("youth_resources", {})
+        self.therapeutic_interventions = responses.get("therapeutic_interventions", {})
+        self.greeting_categories = [("greeting", k) for k in self.greetings]
+        self.normalized_matcher = build_normalized_matcher(self.greeting_categories)
+        self.phrase_index = build_phrase_index(self.phrase_bank)
+        # The lexicon fingerprint is part of every result-cache key, so
+        # cached sentiments from an older lexicon are never served.
+        self.lexicon = build_lexicon(responses)
+
+
+MESSAGE_MATCHER = build_message_matcher()
+CORE_EMOTION_MATCHER = matcher.KeywordMatcher(CORE_EMOTION_KEYWORDS, cache_size=128)
+
+CONTENT = content_registry.ContentRegistry(services.RESPONSES_PATH, ResponseContent, poll_interval=CONTENT_POLL_S)
+CONTENT.load()
+
+
+def content():
+    """The live ResponseContent; read it once per request."""
+    return CONTENT.current
+
+
+def reload_content(responses=None):
+    """Hot-reload hook: rebuilds the content (from ``responses`` or the file) and swaps it in."""
+    if responses is not None:
+        return CONTENT.publish(responses)
+    CONTENT.reload(force=True)
+    return CONTENT.current
+
+
+def scan_message(text):
+    """Scans a raw message once; the result is shared by every classifier."""
+    return MESSAGE_MATCHER.scan((text or "").strip().lower())
+
+
 class AdvancedSentimentAnalyzer:
-    def __init__(self, model_name="aubmindlab/bert-base-arabertv2", max_context_turns=5):
+    # Load states reported by status()
+    STATE_DISABLED = "disabled"   # no model configured; lexicon only
+    STATE_LOADING = "loading"     # serving with the lexicon until the model is warm
+    STATE_READY = "ready"         # model (local or shared server) in use
+    STATE_FALLBACK = "fallback"   # model unavailable or failed to load; lexicon only
+
+    def __init__(self, model_name=MODEL_NAME, max_context_turns=5, local_only=False, background=False):
+        self.model_name = model_name
+        self.state = self.STATE_LOADING
+        self.created_at = time.time()
+        self.ready_at = None
         self.tokenizer = None
-        self.model = None
+        self.backend = None
+        self.token_cache = None
+        self.result_cache = result_cache.ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL) if RESULT_CACHE_SIZE else None
+        self.shared_result_cache = None
+        if self.result_cache is not None and RESULT_CACHE_SHARED:
+            self.shared_result_cache = result_cache.SharedResultCache(
+                os.path.join(services.DATA_DIR, "result_cache.db"), RESULT_CACHE_TTL
+            )
+        # Anything with infer(turns, timeout) -> probabilities and
+        # infer_many(items, timeout): the local MicroBatcher or a ModelClient
+        # for the shared model server.
+        self.predictor = None
         self.max_context_turns = max_context_turns
         self.labels = {
             0: "حزين",  # Mapped from "حزن/اكتئاب"
@@ -133,49 +345,104 @@ class AdvancedSentimentAnalyzer:
 
         if not model_name:
             logger.info("No model_name provided — using lexicon fallback only.")
+            self.state = self.STATE_DISABLED
             return
 
-        if not AutoTokenizer or not AutoModelForSequenceClassification:
-            logger.warning("transformers or required classes unavailable — using lexicon fallback only.")
+        if MODEL_SOCKET and not local_only:
+            # Stays loading (lexicon only) until the server answers a ping.
+            logger.info("Using shared model server at %s.", MODEL_SOCKET)
+            client = model_server.ModelClient(MODEL_SOCKET)
+            if background:
+                threading.Thread(target=self._watch_model_server, args=(client,), name="model-server-probe",
+                                 daemon=True).start()
+            elif client.ping():
+                self._set_predictor(client)
             return
 
-        logger.info("Loading model %s on %s...", model_name, device)
+        if background:
+            threading.Thread(target=self._load_model, name="model-loader", daemon=True).start()
+        else:
+            self._load_model()
+
+    def _set_predictor(self, predictor):
+        # A single attribute assignment, so request threads switch from the
+        # lexicon to the model atomically.
+        self.predictor = predictor
+        self.ready_at = time.time()
+        self.state = self.STATE_READY
+
+    def _watch_model_server(self, client):
+        """Pings the model server forever; the first answer switches to the model."""
+        was_up = False
+        while True:
+            up = client.ping()
+            if up and self.predictor is None:
+                self._set_predictor(client)
+                logger.info("Model server ready after %.1fs.", self.ready_at - self.created_at)
+            elif up != was_up and self.predictor is not None:
+                if up:
+                    logger.info("Model server at %s is back.", client.socket_path)
+                else:
+                    logger.warning("Model server at %s is down; using the lexicon fallback.", client.socket_path)
+            was_up = up
+            time.sleep(MODEL_PING_INTERVAL_S)
+
+    def _live_predictor(self):
+        """The predictor, or None while the shared model server is unreachable."""
+        predictor = self.predictor
+        if predictor is not None and not getattr(predictor, 'available', True):
+            return None
+        return predictor
+
+    def _load_model(self):
+        import_ml_backend()
+        logger.info("Loading model %s with the %s backend on %s...", self.model_name, INFERENCE_BACKEND, device)
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForSequenceClassification.from_pretrained(model_name, num_labels=5)
-            if TORCH_AVAILABLE and torch is not None and hasattr(self.model, 'to'):
-                self.model = self.model.to(device)
+            self.backend = backends.load_backend(INFERENCE_BACKEND, self.model_name, MODEL_ARTIFACTS_DIR, device=device)
+        except ImportError:
+            logger.warning("Inference backend %s unavailable — using lexicon fallback only.", INFERENCE_BACKEND)
+            self.state = self.STATE_FALLBACK
+            return
         except Exception:
             logger.exception("Failed to load ML model; continuing with fallback lexicon approach.")
-            self.tokenizer = None
-            self.model = None
+            self.state = self.STATE_FALLBACK
             return
 
+        self.tokenizer = self.backend.tokenizer
+        self.token_cache = token_cache.TokenCache(
+            self.tokenizer, max_entries=TOKEN_CACHE_ENTRIES, max_tokens=TOKEN_CACHE_MAX_TOKENS,
+            max_length=backends.MAX_LENGTH,
+        )
+        self._set_predictor(inference.MicroBatcher(
+            self._predict_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, name='sentiment'
+        ))
+        logger.info("Model ready after %.1fs.", self.ready_at - self.created_at)
+
+    def status(self):
+        """Load state for readiness probes."""
+        state = self.state
+        if state == self.STATE_READY and self._live_predictor() is None:
+            state = self.STATE_FALLBACK
+        return {
+            'state': state,
+            'model': self.model_name,
+            'inference_backend': getattr(self.backend, 'name', None),
+            'backend': 'remote' if isinstance(self.predictor, model_server.ModelClient) else ('local' if self.predictor else None),
+            'token_cache': self.token_cache.stats() if self.token_cache else None,
+            'result_cache': self.result_cache.stats() if self.result_cache else None,
+            'time_to_ready_s': round(self.ready_at - self.created_at, 3) if self.ready_at else None,
+            'uptime_s': round(time.time() - self.created_at, 3),
+        }
+
     def generate_phoenix_insight(self, worry_text):
         """
         Generates a 'Phoenix Insight' - a reframing of a worry into wisdom.
         Uses rule-based patterns or falls back to general wisdom.
         """
-        worry_lower = worry_text.lower()
-        
         # 1. Check for specific worry themes
-        if any(w in worry_lower for w in ["فشل", "أفشل", "خسارة", "ما أنجح", "fail"]):
-            return "الفشل ليس نقيض النجاح، بل هو جزء منه. كل عثرة هي درس يقربك خطوة نحو هدفك."
-        
-        if any(w in worry_lower for w in ["وحدة", "وحيد", "أحد", "lonely", "alone"]):
-            return "الوحدة فرصة لاكتشاف ذاتك ومصادقتها. أنت بصحبة نفسك، وهي صحبة تستحق التقدير."
-            
-        if any(w in worry_lower for w in ["خوف", "خائف", "مرعوب", "fear", "scared"]):
-            return "الخوف مجرد ظل لشيء لم يحدث بعد. واجهه بالنور، وسيختفي."
-            
-        if any(w in worry_lower for w in ["مستقبل", "بكرة", "غدا", "future"]):
-            return "المستقبل يُبنى بقرارات اليوم. ركز على لحظتك الحالية، فهي كل ما تملك."
-            
-        if any(w in worry_lower for w in ["حب", "فراق", "تركني", "love", "breakup"]):
-            return "القلب الذي ينكسر يفسح مجالاً لنور جديد ليدخله. أنت تستحق الحب، ابدأ بحب نفسك."
-
-        if any(w in worry_lower for w in ["موت", "فقدان", "death", "loss"]):
-            return "الألم ثمن الحب. من نحبهم يتركون بصمة في أرواحنا لا تمحى، فهم يعيشون فينا."
+        theme = scan_message(worry_text).first(PHOENIX_CATEGORIES)
+        if theme is not None:
+            return PHOENIX_THEMES[theme[1]][1]
 
         # 2. Random Wisdom
         wisdoms = [
@@ -189,81 +456,176 @@ class AdvancedSentimentAnalyzer:
         return random.choice(wisdoms)
 
     def analyze_sentiment(self, user_input, conversation_context):
-        if not getattr(self, 'model', None):
-            return self.fallback_sentiment(user_input), None, self.check_for_risk(user_input)
+        """Returns (label, probabilities, risk), served from the result cache when possible."""
+        start = time.perf_counter()
+        result, path = self._analyze_sentiment_cached(user_input, conversation_context)
+        metrics.SENTIMENT_SECONDS.observe(time.perf_counter() - start, path)
+        return result
+
+    def _analyze_sentiment_cached(self, user_input, conversation_context):
+        """Returns (result, path) where path is model, lexicon, model_fallback or cache."""
+        if self.result_cache is None:
+            predictor = self._live_predictor()
+            result, cacheable = self._analyze_sentiment(user_input, conversation_context, predictor)
+            return result, self._sentiment_path(predictor, cacheable)
+
+        predictor = self._live_predictor()
+        if predictor is None:
+            # The lexicon path ignores the context.
+            key = result_cache.make_key("lexicon", CONTENT.current.lexicon.fingerprint, (user_input or "").strip())
+        else:
+            context = [self.preprocess_arabic_text(c) for c in (conversation_context or [])]
+            context = context[-(self.max_context_turns - 1):] if self.max_context_turns > 1 else []
+            key = result_cache.make_key(
+                self.model_name, INFERENCE_BACKEND, CONTENT.current.lexicon.fingerprint, (user_input or "").strip(), *context
+            )
+
+        cached = self.result_cache.get(key)
+        if cached is None and self.shared_result_cache is not None:
+            try:
+                shared = self.shared_result_cache.get(key)
+            except Exception:
+                logger.exception("Shared result cache lookup failed")
+                shared = None
+            if shared is not None:
+                label, probabilities, risk = shared
+                cached = (label, np.asarray(probabilities) if probabilities is not None else None, risk)
+                self.result_cache.put(key, cached)
+        if cached is not None:
+            return cached, "cache"
+
+        result, cacheable = self._analyze_sentiment(user_input, conversation_context, predictor)
+        # Results that fell back after a model failure are not cached under the model key.
+        if cacheable:
+            self.result_cache.put(key, result)
+            if self.shared_result_cache is not None:
+                label, probabilities, risk = result
+                try:
+                    self.shared_result_cache.put(
+                        key, [label, probabilities.tolist() if probabilities is not None else None, risk]
+                    )
+                except Exception:
+                    logger.exception("Shared result cache write failed")
+        return result, self._sentiment_path(predictor, cacheable)
+
+    @staticmethod
+    def _sentiment_path(predictor, cacheable):
+        if predictor is None:
+            return "lexicon"
+        return "model" if cacheable else "model_fallback"
+
+    def _analyze_sentiment(self, user_input, conversation_context, predictor=None):
+        """Uncached analysis; returns ((label, probabilities, risk), cacheable)."""
+        if predictor is None:
+            predictor = self.predictor
+        if predictor is None:
+            return (self.fallback_sentiment(user_input), None, self.check_for_risk(user_input)), True
 
         context_list = [self.preprocess_arabic_text(c) for c in (conversation_context or [])]
         context_list.append(self.preprocess_arabic_text(user_input))
         relevant_context = context_list[-self.max_context_turns:]
-        contextual_input = " [SEP] ".join(relevant_context)
 
         try:
-            encoding = self.tokenizer.encode_plus(
-                contextual_input, max_length=512, padding='max_length', truncation=True, return_tensors='pt'
-            )
+            probabilities = np.asarray(predictor.infer(relevant_context, timeout=INFERENCE_BUDGET_MS / 1000.0))
+        except inference.InferenceTimeout:
+            logger.warning("Model inference over budget; using lexicon fallback.")
+            return (self.fallback_sentiment(user_input), None, self.check_for_risk(user_input)), False
         except Exception:
-             return self.fallback_sentiment(user_input), None, self.check_for_risk(user_input)
-
-        if not TORCH_AVAILABLE or torch is None:
-            return self.fallback_sentiment(user_input), None, self.check_for_risk(user_input)
-
-        input_ids = encoding['input_ids'].to(device)
-        attention_mask = encoding['attention_mask'].to(device)
+            logger.warning("Model inference unavailable; using lexicon fallback.")
+            return (self.fallback_sentiment(user_input), None, self.check_for_risk(user_input)), False
 
-        with torch.no_grad():
-            outputs = self.model(input_ids=input_ids, attention_mask=attention_mask)
-
-        logits = getattr(outputs, 'logits', None)
-        if logits is None:
-            return self.fallback_sentiment(user_input), None, self.check_for_risk(user_input)
-
-        probabilities = torch.softmax(logits, dim=1).cpu().numpy()[0]
         predicted_class_id = int(np.argmax(probabilities))
         predicted_sentiment = self.labels.get(predicted_class_id, "محايد/أخرى")
         
         # Override with topic detection
-        for topic, keywords in TOPIC_OVERRIDE_KEYWORDS.items():
-            if any(k in user_input for k in keywords):
-                predicted_sentiment = topic
-                break
+        override = scan_message(user_input).first(OVERRIDE_CATEGORIES)
+        if override is not None:
+            predicted_sentiment = override[1]
                 
         risk_level = self.check_for_risk(user_input)
-        return predicted_sentiment, probabilities, risk_level
+        return (predicted_sentiment, probabilities, risk_level), True
+
+    def analyze_many(self, texts, contexts=None):
+        """Bulk analyze_sentiment: returns one (label, probabilities, risk) per text.
+
+        ``contexts[i]`` is the conversation before ``texts[i]``. The lexicon
+        path scores all texts in one vectorized pass; the model path runs in
+        chunks of BULK_CHUNK_SIZE through the batcher or model server. The
+        result cache is bypassed so a backfill does not evict live entries.
+        """
+        texts = list(texts)
+        contexts = list(contexts) if contexts is not None else [None] * len(texts)
+        if len(contexts) != len(texts):
+            raise ValueError("texts and contexts must have the same length")
+
+        risks = [self.check_for_risk(t) for t in texts]
+        predictor = self._live_predictor()
+        if predictor is None:
+            return list(zip(self.fallback_sentiment_many(texts), [None] * len(texts), risks))
+
+        results = []
+        for start in range(0, len(texts), BULK_CHUNK_SIZE):
+            chunk = texts[start:start + BULK_CHUNK_SIZE]
+            turns = []
+            for text, context in zip(chunk, contexts[start:start + BULK_CHUNK_SIZE]):
+                context_list = [self.preprocess_arabic_text(c) for c in (context or [])]
+                context_list.append(self.preprocess_arabic_text(text))
+                turns.append(context_list[-self.max_context_turns:])
+            try:
+                outputs = predictor.infer_many(turns, timeout=BULK_TIMEOUT_S)
+            except Exception:
+                logger.warning("Bulk model inference failed; using lexicon fallback for %d texts.", len(chunk))
+                labels = self.fallback_sentiment_many(chunk)
+                results.extend(zip(labels, [None] * len(chunk), risks[start:start + len(chunk)]))
+                continue
+            for text, probs, risk in zip(chunk, outputs, risks[start:start + len(chunk)]):
+                probabilities = np.asarray(probs)
+                label = self.labels.get(int(np.argmax(probabilities)), "محايد/أخرى")
+                override = scan_message(text).first(OVERRIDE_CATEGORIES)
+                if override is not None:
+                    label = override[1]
+                results.append((label, probabilities, risk))
+        return results
+
+    def _predict_batch(self, contexts):
+        """Runs one forward pass over a micro-batch of turn lists.
+
+        Turns are encoded through the token cache, so only turns not seen
+        before are tokenized; the batch is padded to its longest sequence.
+        """
+        sequences = [self.token_cache.encode_context(turns) for turns in contexts]
+        input_ids, attention_mask = token_cache.pad_batch(sequences, self.tokenizer.pad_token_id)
+        return list(self.backend.forward(input_ids, attention_mask))
 
     def fallback_sentiment(self, message):
         text = message or ""
         
         # Check for Topic Overrides first
-        for topic, keywords in TOPIC_OVERRIDE_KEYWORDS.items():
-            if any(k in text for k in keywords):
-                return topic
+        override = scan_message(text).first(OVERRIDE_CATEGORIES)
+        if override is not None:
+            return override[1]
 
         norm = utils.normalize_text(text)
         if not norm:
             return "محايد/أخرى"
 
-        words_original = norm.split()
-        words_stemmed = [utils.simple_stem(w) for w in words_original]
-        norm_polarity = {utils.simple_stem(utils.normalize_text(k)): v for k, v in EMOTION_POLARITY.items()}
-
+        index = CONTENT.current.lexicon
         score = 0.0
         matches = 0
         detected_emotions = []
+        previous = None
 
-        for i, w_stem in enumerate(words_stemmed):
-            polarity = norm_polarity.get(w_stem, 0)
-            if polarity != 0:
+        for word in norm.split():
+            entry = index.lookup(stemmer.stem(word))
+            if entry is not None and entry[1] != 0:
+                emotion, polarity = entry
                 matches += 1
-                # Find the emotion key for this stem
-                for emotion, val in EMOTION_POLARITY.items():
-                    if utils.simple_stem(utils.normalize_text(emotion)) == w_stem:
-                        detected_emotions.append(emotion)
-                        break
-
-                if i > 0 and words_original[i - 1] in ("لا", "ليس", "لم", "لن", "غير", "ما"):
+                detected_emotions.append(emotion)
+                if previous in NEGATION_WORDS:
                     score -= polarity * 1.5
                 else:
                     score += polarity
+            previous = word
         
         if matches == 0:
             return "محايد/أخرى"
@@ -277,66 +639,63 @@ class AdvancedSentimentAnalyzer:
 
         return "محايد/أخرى"
 
+    def fallback_sentiment_many(self, messages):
+        """fallback_sentiment for many messages, scored with LexiconIndex.score_many."""
+        messages = [m or "" for m in messages]
+        overrides = [scan_message(m).first(OVERRIDE_CATEGORIES) for m in messages]
+        docs = [norm.split() for norm in utils.normalize_many(messages)]
+        _, emotions = CONTENT.current.lexicon.score_many(docs, NEGATION_WORDS)
+        return [
+            override[1] if override is not None else (emotion or "محايد/أخرى")
+            for override, emotion in zip(overrides, emotions)
+        ]
+
     def check_for_risk(self, text):
-        for word in CRISIS_KEYWORDS:
-            if word in text.lower():
-                return "خطورة عالية - يرجى طلب المساعدة"
+        if CRISIS_CATEGORY in scan_message(text):
+            return "خطورة عالية - يرجى طلب المساعدة"
         return "خطورة منخفضة"
 
     def preprocess_arabic_text(self, text):
         return text.replace('\n', ' ').strip()
 
-    def _handle_intro_questions(self, text):
+    def _handle_intro_questions(self, text, content):
         """
         Detects questions about the bot's identity, capabilities, or general trust-building chat.
         """
-        t = text.lower()
-        
-        # 1. Identity (Who are you?)
-        if any(x in t for x in ["من انت", "من أنت", "عرفني", "مين معي", "مين انت", "اسمك", "عرف عن نفسك", "شكون انت"]):
-            return random.choice(INTRO_RESPONSES.get("self", ["أنا رفيقك الذكي."]))
-            
-        # 2. Capabilities (What do you do?)
-        if any(x in t for x in ["ماذا تفعل", "شو بتعمل", "وظيفتك", "فايدتك", "عملك", "ايش تسوي", "شنو دير", "تطبيق ايش", "فائدة التطبيق"]):
-            return random.choice(INTRO_RESPONSES.get("capabilities", ["أنا هنا لمساعدتك."]))
-            
-        # 3. Trust (Are you human? Privacy?)
-        if any(x in t for x in ["روبوت", "انسان", "بشر", "آلة", "تخزين", "خصوصية", "سرية", "تفضحني", "حقيقي"]):
-            return random.choice(INTRO_RESPONSES.get("trust", ["أنا هنا لأسمعك بسرية تامة."]))
-            
-        # 4. General Small Talk (Openers)
-        if any(x in t for x in ["نتعرف", "ندردش", "نسولف", "نتكلم", "احكي", "ملل", "زهقان", "طفشان", "ضايج"]):
-            return random.choice(INTRO_RESPONSES.get("general_chat", ["أنا جاهز للحديث عن أي شيء!"]))
-            
+        hit = scan_message(text).first(INTRO_CATEGORIES)
+        if hit is not None:
+            key = hit[1]
+            return random.choice(content.intro.get(key, [INTRO_DEFAULTS[key]]))
         return None
 
-    def _handle_greeting(self, normalized_text):
-        for key, resp in GREETING_RESPONSES.items():
-            if key in normalized_text:
-                return resp
+    def _handle_greeting(self, normalized_text, content):
+        hit = content.normalized_matcher.scan(normalized_text).first(content.greeting_categories)
+        if hit is not None:
+            return content.greetings[hit[1]]
         return None
 
-    def _handle_phrase_bank(self, normalized_text):
-        if not (isinstance(PHRASE_BANK, dict) and PHRASE_BANK):
+    def _handle_phrase_bank(self, normalized_text, content):
+        with metrics.STAGE_SECONDS.time("phrase_bank"):
+            return self._match_phrase_bank(normalized_text, content)
+
+    def _match_phrase_bank(self, normalized_text, content):
+        phrase_bank = content.phrase_bank
+        if not (isinstance(phrase_bank, dict) and phrase_bank):
             return None
         try:
-            keys = list(PHRASE_BANK.keys())
-            match = difflib.get_close_matches(normalized_text, keys, n=1, cutoff=0.6) # Increased cutoff
-            if match:
-                return PHRASE_BANK.get(match[0])
+            match = content.phrase_index.best(normalized_text)
+            if match is not None:
+                return phrase_bank.get(match)
         except Exception:
-            logger.warning("Error during difflib matching in phrase bank.")
+            logger.warning("Error during fuzzy matching in phrase bank.")
         return None
 
     def _detect_topic(self, text):
-        text = text.lower()
-        for topic, keywords in TOPIC_KEYWORDS.items():
-            if any(k in text for k in keywords):
-                return topic
-        return None
+        hit = scan_message(text).first(TOPIC_CATEGORIES)
+        return hit[1] if hit is not None else None
 
     def _map_sentiment_to_core(self, sentiment):
-        # Maps varied sentiment strings to core keys in EMOTION_RESPONSES
+        # Maps varied sentiment strings to core keys in the "emotions" responses
         if not sentiment: return "محايد/أخرى"
         
         s = sentiment.lower()
@@ -345,54 +704,81 @@ class AdvancedSentimentAnalyzer:
         if s in TOPIC_OVERRIDE_KEYWORDS:
             return s
             
-        if any(x in s for x in ["سعيد", "مبسوط", "فرحان", "متفائل", "رائع", "ممتاز", "جميل", "مذهل", "سعيدة", "مبسوطة", "فرحانة"]):
-            return "سعيد"
-        if any(x in s for x in ["حزين", "مكتئب", "متضايق", "محبط", "يأس", "سيء", "فاشل", "مشكلة", "صعب", "حزن", "حزينة", "مكتئبة", "متضايقة", "وحيدة"]):
-            return "حزين"
-        if any(x in s for x in ["غاضب", "عصبي", "مستفز", "غاضبة", "عصبية"]):
-            return "غاضب"
-        if any(x in s for x in ["قلق", "متوتر", "خايف", "خائف", "قلقة", "متوترة", "خائفة"]):
-            return "قلق"
-        if any(x in s for x in ["وحدة", "وحيد"]):
-            return "وحدة" # Note: 'وحدة' is also mapped to 'حزين' above? No, 'وحدة' has its own key in EMOTION_POLARITY but handled as 'حزين' in logic usually? 
-            # In EMOTION_RESPONSES (json), is there a "وحدة" key?
-            # Let's check responses.json again.
-        if any(x in s for x in ["تعبان", "مرهق"]):
-            return "تعبان"
-        
-        return "محايد/أخرى"
+        core = CORE_EMOTION_MATCHER.scan(s).first(CORE_EMOTION_KEYWORDS)
+        return core if core is not None else "محايد/أخرى"
 
     def generate_response(self, sentiment, risk_level, user_input=None, conversation_context=None, active_topic=None):
+        stream = self.generate_response_parts(
+            sentiment, risk_level, user_input=user_input, conversation_context=conversation_context,
+            active_topic=active_topic,
+        )
+        parts = []
+        while True:
+            try:
+                parts.append(next(stream))
+            except StopIteration as stop:
+                return " ".join(parts), stop.value
+
+    def generate_response_parts(self, sentiment, risk_level, user_input=None, conversation_context=None, active_topic=None):
+        """Yields response segments in display order as they are assembled and
+        returns the new topic (``topic = yield from ...``). Joined with spaces
+        they form generate_response()'s text.
+
+        The generate_response stage histogram only counts time spent producing
+        segments, not time the caller spends sending them."""
+        stream = self._generate_response_parts(sentiment, risk_level, user_input, active_topic)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    part = next(stream)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield part
+        finally:
+            metrics.STAGE_SECONDS.observe(elapsed, "generate_response")
+
+    def _generate_response_parts(self, sentiment, risk_level, user_input, active_topic):
         if "خطورة عالية" in risk_level:
-            return CRISIS_RESPONSE_AR, "crisis"
+            yield CRISIS_RESPONSE_AR
+            return "crisis"
 
         user_text = (user_input or "").strip()
         norm = utils.normalize_text(user_text)
+        # One content snapshot for the whole response, even if a reload lands mid-request.
+        content = CONTENT.current
 
         # 0. Check for Continuation
-        CONTINUATION_KEYWORDS = ["تابع", "كمل", "بعدين", "اكمل", "المزيد", "استمر", "ثم", "وبعدين", "شنو بعد"]
-        if active_topic and any(k in norm for k in CONTINUATION_KEYWORDS):
+        if active_topic and CONTINUATION_CATEGORY in content.normalized_matcher.scan(norm):
              # Try to provide more content for the active topic
              if active_topic in TOPIC_RESPONSES:
                  # Get a response that hasn't been used recently if possible (random for now)
-                 return random.choice(TOPIC_RESPONSES[active_topic]), active_topic
-             elif active_topic in INTRO_RESPONSES:
-                 return random.choice(INTRO_RESPONSES[active_topic]), active_topic
+                 yield random.choice(TOPIC_RESPONSES[active_topic])
+                 return active_topic
+             elif active_topic in content.intro:
+                 yield random.choice(content.intro[active_topic])
+                 return active_topic
 
         # 1. Greetings & Intro (Priority 1)
         if norm:
-            greeting_resp = self._handle_greeting(norm)
+            greeting_resp = self._handle_greeting(norm, content)
             if greeting_resp:
-                return greeting_resp, "greeting"
+                yield greeting_resp
+                return "greeting"
 
             # Check for Intro/Identity questions
-            intro_resp = self._handle_intro_questions(user_text) 
+            intro_resp = self._handle_intro_questions(user_text, content)
             if intro_resp:
-                return intro_resp, "intro"
+                yield intro_resp
+                return "intro"
 
-            phrase_bank_resp = self._handle_phrase_bank(norm)
+            phrase_bank_resp = self._handle_phrase_bank(norm, content)
             if phrase_bank_resp:
-                return phrase_bank_resp, "general"
+                yield phrase_bank_resp
+                return "general"
 
         # 2. Analyze Context & Sentiment
         core_emotion = self._map_sentiment_to_core(sentiment)
@@ -403,17 +789,16 @@ class AdvancedSentimentAnalyzer:
         
         is_long_message = len(user_text.split()) > 7
 
-        # 3. Construct Response Components
-        emotion_data = EMOTION_RESPONSES.get(core_emotion, EMOTION_RESPONSES.get("محايد/أخرى"))
+        # 3. Construct and send response components in display order
+        emotion_data = content.emotions.get(core_emotion, content.emotions.get("محايد/أخرى"))
         
-        # Validation (Mirroring)
+        # Always validate emotion first (Mirroring)
         validation_pool = emotion_data.get("validation", [])
-        validation = random.choice(validation_pool) if validation_pool else "أسمعك بوضوح."
+        yield random.choice(validation_pool) if validation_pool else "أسمعك بوضوح."
 
         # Topic Specific Response
-        topic_response = ""
         if topic and topic in TOPIC_RESPONSES:
-            topic_response = random.choice(TOPIC_RESPONSES[topic])
+            yield random.choice(TOPIC_RESPONSES[topic])
         elif active_topic and not topic: # If no new topic, but we have an active one, maybe reinforce it?
             # Optional: Don't repeat topic response unless asked, just validate emotion
             pass
@@ -428,35 +813,26 @@ class AdvancedSentimentAnalyzer:
         # Therapeutic Intervention (Optional)
         intervention = ""
         if random.random() < 0.2 and core_emotion in ["قلق", "حزين", "غاضب"]:
-             if "grounding" in THERAPEUTIC_INTERVENTIONS:
-                 intervention = random.choice(THERAPEUTIC_INTERVENTIONS["grounding"])
-        elif random.random() < 0.1 and "reframing" in THERAPEUTIC_INTERVENTIONS:
-             intervention = random.choice(THERAPEUTIC_INTERVENTIONS["reframing"])
+             if "grounding" in content.therapeutic_interventions:
+                 intervention = random.choice(content.therapeutic_interventions["grounding"])
+        elif random.random() < 0.1 and "reframing" in content.therapeutic_interventions:
+             intervention = random.choice(content.therapeutic_interventions["reframing"])
 
-        # 4. Assemble Final Response
-        # Strategy: Vary the combination to avoid repetition
-        
-        parts = []
-        
-        # Always validate emotion first
-        parts.append(validation)
-
-        # If we have a specific topic response, use it
-        if topic_response:
-            parts.append(topic_response)
-        
         # Add intervention or question (usually not both to avoid overwhelming)
         if intervention:
-            parts.append(intervention)
+            yield intervention
         elif question:
-            parts.append(question)
-            
-        return " ".join(parts), final_topic
+            yield question
+
+        return final_topic
 
 
-# Initialize the analyzer once when the module is loaded
+# Initialize the analyzer once when the module is loaded. The model warms up
+# in the background; until then requests are served by the lexicon fallback.
+# The model server process must neither load a second copy nor ping itself.
 try:
-    analyzer = AdvancedSentimentAnalyzer()
+    analyzer = AdvancedSentimentAnalyzer(model_name=None if MODEL_SERVER_PROCESS else MODEL_NAME,
+                                         background=True)
 except Exception as e:
     logger.error(f"Failed to initialize AdvancedSentimentAnalyzer: {e}")
     analyzer = AdvancedSentimentAnalyzer(model_name=None)
\ No newline at end of file
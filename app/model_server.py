@@ -0,0 +1,261 @@
+"""Model-serving sidecar: one process loads the model for every worker.
+
+The server listens on a Unix socket and feeds requests from all gunicorn
+workers into a single MicroBatcher. Workers talk to it through ModelClient,
+which exposes the same ``infer(turns, timeout)`` call as the in-process
+batcher, so the analyzer does not care where the model runs.
+
+Frames are a 4-byte big-endian length followed by a UTF-8 JSON object:
+``{"turns": [...]}`` -> ``{"probabilities": [...]}`` or ``{"error": ...}``.
+Bulk callers send ``{"batch": [[...], ...]}`` and get one probability list
+per entry back. ``{"ping": true}`` -> ``{"ok": true}`` is the health check.
+Turns (the recent conversation, newest last) are sent unjoined so the
+server's token cache can reuse earlier turns from every worker.
+
+Usage::
+
+    IMMA_MODEL_SOCKET=/tmp/imma-model.sock python -m app.model_server [--supervise]
+
+With ``--supervise`` (as gunicorn.conf.py starts it) a small parent process
+restarts the server with backoff when it crashes. If the model cannot be
+loaded at all, the server exits with EXIT_NO_MODEL and is not restarted;
+workers then keep serving the lexicon fallback and report it in
+/health/ready.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import struct
+import logging
+import argparse
+import threading
+import subprocess
+import socketserver
+
+from .inference import InferenceTimeout
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>I')
+MAX_FRAME = 16 * 1024 * 1024
+
+EXIT_NO_MODEL = 3
+RESTART_BACKOFF_S = (1, 2, 5, 10, 30, 60)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_frame(sock, obj):
+    payload = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock):
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if length > MAX_FRAME:
+        raise ConnectionError('frame too large')
+    return json.loads(_recv_exact(sock, length).decode('utf-8'))
+
+
+class ModelClient:
+    """Thin worker-side client with per-call timeouts.
+
+    After a connection failure the client reports the server as unavailable
+    for ``retry_after`` seconds, so requests fall back immediately instead of
+    each paying the connect timeout.
+    """
+
+    def __init__(self, socket_path, retry_after=5.0):
+        self.socket_path = socket_path
+        self.retry_after = retry_after
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _socket(self, timeout):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None or getattr(self._local, 'pid', None) != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+            self._local.pid = os.getpid()
+        sock.settimeout(timeout)
+        return sock
+
+    def _drop(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def ping(self, timeout=1.0):
+        """Health check that ignores the retry window; updates ``available`` either way."""
+        try:
+            sock = self._socket(timeout)
+            send_frame(sock, {'ping': True})
+            reply = recv_frame(sock)
+        except (OSError, ConnectionError, ValueError):
+            self._drop()
+            self._down_until = time.monotonic() + self.retry_after
+            return False
+        ok = bool(reply.get('ok'))
+        self._down_until = 0.0 if ok else time.monotonic() + self.retry_after
+        return ok
+
+    def infer(self, turns, timeout=None):
+        return self._call({'turns': list(turns)}, timeout)
+
+    def infer_many(self, items, timeout=None):
+        return self._call({'batch': [list(turns) for turns in items]}, timeout)
+
+    def _call(self, request, timeout):
+        if not self.available:
+            raise ConnectionError('model server unavailable')
+        try:
+            sock = self._socket(timeout)
+            send_frame(sock, request)
+            reply = recv_frame(sock)
+        except socket.timeout:
+            # The reply may still arrive later; never reuse this connection.
+            self._drop()
+            raise InferenceTimeout('model server exceeded %.0f ms' % ((timeout or 0) * 1000))
+        except (OSError, ConnectionError, ValueError):
+            self._drop()
+            self._down_until = time.monotonic() + self.retry_after
+            raise ConnectionError('model server unavailable')
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['probabilities']
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        predictor = self.server.predictor
+        budget = self.server.budget
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                if request.get('ping'):
+                    reply = {'ok': True}
+                elif 'batch' in request:
+                    # Bulk work is bounded by the client's socket timeout instead of the live budget.
+                    results = predictor.infer_many(request['batch'])
+                    reply = {'probabilities': [[float(p) for p in probs] for probs in results]}
+                else:
+                    probabilities = predictor.infer(request['turns'], timeout=budget)
+                    reply = {'probabilities': [float(p) for p in probabilities]}
+            except Exception as exc:
+                reply = {'error': str(exc)}
+            try:
+                send_frame(self.request, reply)
+            except OSError:
+                return
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, predictor, budget=None):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, _Handler)
+        self.predictor = predictor
+        self.budget = budget
+
+
+def serve(socket_path, model_name=None):
+    # app.ml's module-level analyzer must stay disabled in this process: it
+    # would otherwise be a client of this very server, or load a second copy.
+    os.environ['IMMA_MODEL_SERVER_PROCESS'] = '1'
+    from . import ml
+
+    analyzer = ml.AdvancedSentimentAnalyzer(model_name=model_name or ml.MODEL_NAME, local_only=True)
+    if analyzer.predictor is None:
+        logger.error('Model %s could not be loaded; not starting model server.', analyzer.model_name)
+        raise SystemExit(EXIT_NO_MODEL)
+    server = ModelServer(socket_path, analyzer.predictor, budget=ml.INFERENCE_BUDGET_MS / 1000.0)
+    logger.info('Model server listening on %s', socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def supervise(socket_path, model_name=None):
+    """Runs the server as a child process and restarts it when it dies.
+
+    Returns the exit code to use: EXIT_NO_MODEL when the model cannot be
+    loaded (restarting would not help), 0 after SIGTERM/SIGINT.
+    """
+    cmd = [sys.executable, '-m', 'app.model_server', '--socket', socket_path]
+    if model_name:
+        cmd += ['--model', model_name]
+    child = None
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        if child is not None and child.poll() is None:
+            child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    failures = 0
+    while not stopping:
+        started = time.monotonic()
+        child = subprocess.Popen(cmd)
+        code = child.wait()
+        if stopping:
+            break
+        if code == EXIT_NO_MODEL:
+            logger.error('Model server cannot load its model; not restarting. Workers serve the lexicon '
+                         'fallback and /health/ready?require_model=1 returns 503.')
+            return EXIT_NO_MODEL
+        # A server that ran for a while gets a fresh backoff.
+        failures = 1 if time.monotonic() - started > RESTART_BACKOFF_S[-1] else failures + 1
+        delay = RESTART_BACKOFF_S[min(failures, len(RESTART_BACKOFF_S)) - 1]
+        logger.error('Model server exited with code %s; restarting in %ss.', code, delay)
+        deadline = time.monotonic() + delay
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(0.2)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the sentiment model over a Unix socket.')
+    parser.add_argument('--socket', default=os.environ.get('IMMA_MODEL_SOCKET') or '/tmp/imma-model.sock')
+    parser.add_argument('--model', default=None)
+    parser.add_argument('--supervise', action='store_true', help='restart the server when it crashes')
+    args = parser.parse_args(argv)
+    if args.supervise:
+        sys.exit(supervise(args.socket, args.model))
+    serve(args.socket, args.model)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,82 @@
+"""Quest -> journey index over journeys.json.
+
+Built once per journeys-file version (see ContentEntry.derived). It replaces
+the scan over every journey and quest on each completion.
+"""
+from types import MappingProxyType
+
+
+class JourneyInfo:
+    __slots__ = ('key', 'achievement_id', 'quest_ids', 'quest_set')
+
+    def __init__(self, key, achievement_id, quest_ids):
+        self.key = key
+        # journeys.json keys journeys by slug; the journey's "id" is the achievement it awards.
+        self.achievement_id = achievement_id
+        self.quest_ids = tuple(dict.fromkeys(quest_ids))
+        self.quest_set = frozenset(self.quest_ids)
+
+    def remaining(self, completed):
+        """Quest ids of this journey not in ``completed``, in journey order."""
+        return [q for q in self.quest_ids if q not in completed]
+
+    def is_complete(self, completed):
+        return all(q in completed for q in self.quest_set)
+
+
+class QuestIndex:
+    """quest_id -> [(JourneyInfo, xp)] plus per-journey quest sets."""
+
+    def __init__(self, journeys):
+        by_quest = {}
+        infos = {}
+        for key, journey in (journeys or {}).items():
+            quests = [q for q in journey.get('quests', []) if 'id' in q]
+            info = JourneyInfo(key, journey.get('id'), [q['id'] for q in quests])
+            infos[key] = info
+            seen = set()
+            for quest in quests:
+                # Only a quest's first occurrence within a journey counts.
+                if quest['id'] in seen:
+                    continue
+                seen.add(quest['id'])
+                by_quest.setdefault(quest['id'], []).append((info, quest.get('xp', 0)))
+        self.journeys = MappingProxyType(infos)
+        self._by_quest = {q: tuple(v) for q, v in by_quest.items()}
+
+    def __contains__(self, quest_id):
+        return quest_id in self._by_quest
+
+    def lookup(self, quest_id):
+        """``(JourneyInfo, xp)`` pairs for the journeys containing the quest, in file order."""
+        return self._by_quest.get(quest_id, ())
+
+    def complete(self, quest_id, completed):
+        """Returns ``(xp, completed_achievement_id)`` for finishing ``quest_id``.
+
+        ``completed`` must already include ``quest_id``. If the quest appears
+        in several journeys, the last one wins, as in the original scan.
+        """
+        xp = 0
+        achievement_id = None
+        for info, quest_xp in self.lookup(quest_id):
+            xp = quest_xp
+            if info.is_complete(completed):
+                achievement_id = info.achievement_id
+        return xp, achievement_id
+
+    def remaining(self, completed, journey_keys=None):
+        """Bulk progress: journey key -> {'completed', 'total', 'remaining'}."""
+        keys = self.journeys.keys() if journey_keys is None else journey_keys
+        summary = {}
+        for key in keys:
+            info = self.journeys.get(key)
+            if info is None:
+                continue
+            left = info.remaining(completed)
+            summary[key] = {
+                'completed': len(info.quest_ids) - len(left),
+                'total': len(info.quest_ids),
+                'remaining': left,
+            }
+        return summary
@@ -0,0 +1,98 @@
+"""Bounded LRU + TTL caches for sentiment results.
+
+``ResultCache`` is the in-process tier. ``SharedResultCache`` is an optional
+SQLite tier in the data directory that gunicorn workers share. Keys already
+encode the model and lexicon versions, so old entries simply stop being
+looked up after a reload and expire on their own.
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from . import storage
+
+
+def make_key(*parts):
+    """Stable digest of the given strings/numbers."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(str(part).encode('utf-8'))
+        h.update(b'\x1f')
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU with a per-entry time-to-live."""
+
+    def __init__(self, max_entries=10000, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] < now:
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+class SharedResultCache(storage.SQLiteTable):
+    """Cross-worker tier: key -> JSON value with an absolute expiry time."""
+
+    PURGE_EVERY = 500
+
+    def __init__(self, path, ttl=600.0):
+        super().__init__(path, 'result_cache')
+        self.ttl = ttl
+        self._puts = 0
+
+    def _init_schema(self, conn):
+        conn.execute('CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                     'expires REAL NOT NULL)' % self.table)
+
+    def get(self, key):
+        row = self._conn().execute('SELECT value, expires FROM %s WHERE key = ?' % self.table, (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO %s (key, value, expires) VALUES (?, ?, ?)' % self.table,
+                     (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl))
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM %s WHERE expires < ?' % self.table, (time.time(),))
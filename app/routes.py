@@ -1,17 +1,74 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, Response, g, render_template, request, jsonify, stream_with_context
 from . import services
 from . import ml
 from . import utils
+from . import metrics
+from . import audio
+from . import storage
+import os
 import uuid
 import datetime
 import random
+import json
+import time
+import tempfile
+import concurrent.futures
 
 bp = Blueprint('main', __name__)
 
+@bp.before_app_request
+def _start_request_timer():
+    metrics.ensure_started()
+    ml.CONTENT.ensure_started()
+    g.request_start = time.perf_counter()
+
+@bp.after_app_request
+def _observe_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+    return response
+
+def _timed_stream(body):
+    """Wraps a streamed response body so REQUEST_SECONDS covers the whole
+    stream instead of stopping when the headers are returned."""
+    start = g.pop('request_start', None)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    method = request.method
+
+    def timed():
+        try:
+            yield from body
+        finally:
+            if start is not None:
+                metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, route, method, '200')
+    return timed()
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_route():
+    """
+    Prometheus text exposition, aggregated over all workers (see metrics.py).
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @bp.route('/')
 def index():
     return render_template('index.html')
 
+@bp.route('/health/ready', methods=['GET'])
+def readiness():
+    """
+    Readiness probe. The app serves with the lexicon fallback while the model
+    warms up; pass ?require_model=1 to get 503 until the model is ready.
+    """
+    model_status = ml.analyzer.status()
+    require_model = request.args.get('require_model') in ('1', 'true')
+    if require_model and model_status['state'] != ml.AdvancedSentimentAnalyzer.STATE_READY:
+        starting = model_status['state'] == ml.AdvancedSentimentAnalyzer.STATE_LOADING
+        return jsonify({'status': 'starting' if starting else 'unavailable', 'model': model_status}), 503
+    return jsonify({'status': 'ok', 'model': model_status})
+
 @bp.route('/chat', methods=['POST'])
 def chat():
     """
@@ -48,6 +105,225 @@ def chat():
         ml.logger.exception('Failed during chat processing')
         return jsonify({'response': "حدث خطأ غير متوقع. يرجى المحاولة لاحقاً.", 'sentiment_label': 'محايد', 'error': str(e)}), 500
 
+def _sse(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data, ensure_ascii=False))
+
+def _sse_segments(parts, sent):
+    """Sends each response part as a `segment` event as soon as it is
+    assembled; returns the generator's topic."""
+    while True:
+        try:
+            part = next(parts)
+        except StopIteration as stop:
+            return stop.value
+        sent.append(part)
+        yield _sse('segment', {'text': part})
+
+@bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streaming variant of /chat (Server-Sent Events). Sends a `meta` event with
+    the sentiment and risk as soon as they are known, one `segment` event per
+    response part, then `done` with the full response and topic.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    user_input = data.get('message', '')
+    context = data.get('context', [])
+    active_topic = data.get('active_topic', None)
+
+    def generate():
+        if not user_input:
+            yield _sse('done', {'response': "يرجى إدخال رسالة.", 'sentiment_label': 'محايد', 'active_topic': active_topic})
+            return
+        try:
+            sentiment, probabilities, risk_level = ml.analyzer.analyze_sentiment(user_input, context)
+            yield _sse('meta', {
+                'sentiment_label': sentiment,
+                'probabilities': probabilities.tolist() if probabilities is not None else None,
+                'risk_level': risk_level,
+                'disclaimer': ml.APP_DISCLAIMER
+            })
+
+            parts = []
+            new_topic = yield from _sse_segments(ml.analyzer.generate_response_parts(
+                sentiment, risk_level, user_input=user_input, conversation_context=context,
+                active_topic=active_topic), parts)
+
+            response_text = " ".join(parts)
+            services.save_interaction(user_input, response_text, sentiment)
+            yield _sse('done', {'response': response_text, 'active_topic': new_topic})
+        except Exception as e:
+            ml.logger.exception('Failed during streaming chat')
+            yield _sse('error', {'response': "حدث خطأ غير متوقع. يرجى المحاولة لاحقاً.", 'error': str(e)})
+
+    return Response(stream_with_context(_timed_stream(generate())), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _context_turns(context):
+    """Accepts plain strings or {"role", "content"} messages."""
+    return [c.get('content', '') if isinstance(c, dict) else str(c) for c in (context or [])]
+
+@bp.route('/analyze', methods=['POST'])
+def analyze():
+    """
+    Sentiment and risk for one message, without generating a reply.
+    """
+    try:
+        data = request.get_json(force=True)
+        text = data.get('text', '')
+        if not text:
+            return jsonify({'status': 'error', 'error': 'text is required'}), 400
+        sentiment, probabilities, risk_level = ml.analyzer.analyze_sentiment(text, _context_turns(data.get('context')))
+        return jsonify({
+            'sentiment_label': sentiment,
+            'probabilities': probabilities.tolist() if probabilities is not None else None,
+            'risk_level': risk_level,
+        })
+    except Exception as e:
+        ml.logger.exception('Failed during analysis')
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+ANALYZE_BATCH_CHUNK = 256
+
+@bp.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Bulk scoring for backfills. Accepts JSON {"texts": [...], "contexts": [...]}
+    or an application/x-ndjson body with one {"text", "context"} per line, and
+    streams one NDJSON result per input, in order.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        def rows():
+            for line in request.stream:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    yield None, None, 'line is not valid JSON'
+                    continue
+                if not isinstance(item, dict):
+                    yield None, None, 'line must be a JSON object'
+                    continue
+                yield _batch_row(item.get('text'), item.get('context'))
+    else:
+        data = request.get_json(force=True, silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('texts'), list):
+            return jsonify({'status': 'error', 'error': 'texts must be a list'}), 400
+        texts = data['texts']
+        contexts = data.get('contexts') or [None] * len(texts)
+        if not isinstance(contexts, list) or len(contexts) != len(texts):
+            return jsonify({'status': 'error', 'error': 'texts and contexts must have the same length'}), 400
+        for i, (text, context) in enumerate(zip(texts, contexts)):
+            error = _batch_row(text, context)[2]
+            if error is not None:
+                return jsonify({'status': 'error', 'error': 'item %d: %s' % (i, error)}), 400
+
+        def rows():
+            for text, context in zip(texts, contexts):
+                yield _batch_row(text, context)
+
+    def generate():
+        index = 0
+        chunk = []
+        try:
+            for text, context, error in rows():
+                if error is None:
+                    chunk.append((text, context))
+                    if len(chunk) < ANALYZE_BATCH_CHUNK:
+                        continue
+                # Flush before a bad row so results stay in input order.
+                for line in _analyze_chunk(chunk, index):
+                    yield line
+                index += len(chunk)
+                chunk = []
+                if error is not None:
+                    yield json.dumps({'index': index, 'status': 'error', 'error': error}, ensure_ascii=False) + '\n'
+                    index += 1
+            for line in _analyze_chunk(chunk, index):
+                yield line
+        except Exception as e:
+            # Headers are already sent; report the failure in-band.
+            ml.logger.exception('Failed during batch analysis')
+            yield json.dumps({'index': index, 'status': 'error', 'error': str(e)}, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(_timed_stream(generate())), mimetype='application/x-ndjson')
+
+def _batch_row(text, context):
+    """(text, context turns, error) for one batch input; null text counts as empty."""
+    if text is not None and not isinstance(text, str):
+        return None, None, 'text must be a string'
+    if context is not None and not isinstance(context, list):
+        return None, None, 'context must be a list'
+    return text or '', _context_turns(context), None
+
+def _analyze_chunk(rows, offset):
+    if not rows:
+        return
+    texts, contexts = zip(*rows)
+    for i, (sentiment, probabilities, risk_level) in enumerate(ml.analyzer.analyze_many(texts, contexts)):
+        yield json.dumps({
+            'index': offset + i,
+            'sentiment_label': sentiment,
+            'probabilities': probabilities.tolist() if probabilities is not None else None,
+            'risk_level': risk_level,
+        }, ensure_ascii=False) + '\n'
+
+AUDIO_COPY_CHUNK = 1 << 16
+
+@bp.route('/analyze_audio', methods=['POST'])
+def analyze_audio():
+    """
+    Prosodic voice features (energy, pitch, speaking rate) for an upload sent
+    as multipart field "audio" or as a raw audio/* body. See audio.py.
+    """
+    # Check the size before request.files parses (and spools) the whole body.
+    if request.content_length is not None and request.content_length > audio.AUDIO_MAX_BYTES:
+        return jsonify({'status': 'error', 'error': 'audio file is too large'}), 413
+    if request.mimetype == 'multipart/form-data' and request.content_length is None:
+        return jsonify({'status': 'error', 'error': 'Content-Length is required for multipart uploads'}), 411
+    upload = request.files.get('audio')
+    if upload is not None:
+        stream, name = upload.stream, upload.filename or ''
+    elif request.mimetype.startswith('audio/') or request.mimetype == 'application/octet-stream':
+        # Raw bodies are copied in chunks below and cut off at AUDIO_MAX_BYTES.
+        stream, name = request.stream, ''
+    else:
+        return jsonify({'status': 'error', 'error': 'audio file is required'}), 400
+
+    fd, path = tempfile.mkstemp(prefix='imma-audio-', suffix=os.path.splitext(name)[1][:8])
+    owned = True
+    try:
+        size = 0
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in iter(lambda: stream.read(AUDIO_COPY_CHUNK), b''):
+                size += len(chunk)
+                if size > audio.AUDIO_MAX_BYTES:
+                    return jsonify({'status': 'error', 'error': 'audio file is too large'}), 413
+                fh.write(chunk)
+        if size == 0:
+            return jsonify({'status': 'error', 'error': 'audio file is empty'}), 400
+        # audio.analyze removes the file once its job is done with it.
+        owned = False
+        features = audio.analyze(path)
+        return jsonify({'status': 'success', 'features': features})
+    except audio.Unavailable:
+        return jsonify({'status': 'error', 'error': 'audio analysis is not available'}), 503
+    except audio.DecodeError:
+        return jsonify({'status': 'error', 'error': 'unsupported audio format'}), 400
+    except concurrent.futures.TimeoutError:
+        ml.logger.error('Audio analysis timed out after %ss', audio.AUDIO_TIMEOUT_S)
+        return jsonify({'status': 'error', 'error': 'audio analysis timed out'}), 504
+    except Exception as e:
+        ml.logger.exception('Failed during audio analysis')
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+    finally:
+        if owned:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
 @bp.route('/save_interaction', methods=['POST'])
 def save_interaction_route():
      try:
@@ -63,10 +339,26 @@ def save_interaction_route():
      except Exception as e:
          return {'status': 'error', 'error': str(e)}, 500
 
+def _content_response(path, default, build=lambda data: data):
+    """
+    JSON response for a read-only content file. The body is serialized once
+    per file version; conditional requests get 304 via ETag/Last-Modified.
+    """
+    entry = services.content_entry(path, default)
+    body = entry.derived(('response', build), lambda data: jsonify(build(data)).get_data())
+    resp = Response(body, mimetype='application/json')
+    if entry.etag:
+        resp.set_etag(entry.etag)
+        resp.last_modified = entry.mtime
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+def _wrap_exercises(ex):
+    return {'exercises': ex}
+
 @bp.route('/exercises', methods=['GET'])
 def exercises_route():
-    ex = services.load_exercises_file()
-    return jsonify({'exercises': ex})
+    return _content_response(services.EXERCISES_PATH, [], _wrap_exercises)
 
 @bp.route('/user/create', methods=['POST'])
 def create_user():
@@ -75,11 +367,10 @@ def create_user():
         username = (payload.get('username') or '').strip()
         if not username:
             return jsonify({'status': 'error', 'error': 'username required'}), 400
-        users = services.load_users()
         user_id = str(uuid.uuid4())
-        users[user_id] = {'username': username, 'created': datetime.datetime.utcnow().isoformat() + 'Z'}
-        users[user_id].update({'streak': 0, 'last_checkin': None, 'badges': []})
-        services.save_users(users)
+        user = {'username': username, 'created': datetime.datetime.utcnow().isoformat() + 'Z'}
+        user.update({'streak': 0, 'last_checkin': None, 'badges': []})
+        services.create_user(user_id, user)
         return jsonify({'status': 'ok', 'user_id': user_id, 'username': username})
     except Exception as e:
         ml.logger.exception('Failed to create user')
@@ -90,12 +381,24 @@ def get_progress():
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({'status': 'error', 'error': 'user_id required'}), 400
+    # Without limit or cursor every record is returned, as before pagination.
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if limit is None and cursor:
+        limit = 100
     try:
-        arr = services.load_json_file(services.PROGRESS_PATH, [])
-        user_records = [r for r in arr if r.get('user_id') == user_id]
-        return jsonify({'status': 'ok', 'records': user_records})
+        user_records, next_cursor = services.query_progress(
+            user_id,
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=limit,
+            cursor=cursor,
+        )
+        return jsonify({'status': 'ok', 'records': user_records, 'next_cursor': next_cursor})
+    except storage.InvalidCursor as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
     except Exception as e:
-        ml.logger.exception('Failed to load exercises')
+        ml.logger.exception('Failed to load progress')
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
 @bp.route('/track_progress', methods=['POST'])
@@ -108,23 +411,18 @@ def track_progress():
         if not user_id or not action:
              return jsonify({'status': 'error', 'error': 'Missing data'}), 400
              
-        # Log to progress file
-        data = services.load_json_file(services.PROGRESS_PATH, [])
+        # Log to progress store
         record = {
             'user_id': user_id,
             'action': action,
             'details': payload.get('details', {}),
             'timestamp': datetime.datetime.utcnow().isoformat()
         }
-        data.append(record)
-        services.save_json_file(services.PROGRESS_PATH, data)
+        services.track_progress(record)
         
         # Update User Streak/Badges (Simplified logic)
-        users = services.load_users()
-        if user_id in users:
-            # Logic to update streak would go here
-            services.save_users(users)
-            
+        # Logic to update streak would go here, via services.update_user(user_id, ...)
+
         return jsonify({'status': 'ok', 'record': record})
     except Exception as e:
         ml.logger.exception('Failed to track progress')
@@ -175,40 +473,58 @@ def shake_hope_jar():
     if not user_id:
         return jsonify({'status': 'error', 'error': 'user_id required'}), 400
         
-    note = services.get_random_hope_note(user_id)
+    weighted = request.args.get('uniform') not in ('1', 'true')
+    note = services.get_random_hope_note(user_id, weighted=weighted)
     return jsonify({'status': 'ok', 'note': note})
+
+@bp.route('/hope/notes', methods=['GET'])
+def list_hope_notes():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'error': 'user_id required'}), 400
     try:
-        payload = request.get_json(force=True)
-        record = {
-            'id': str(uuid.uuid4()),
-            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
-            'user_id': payload.get('user_id'),
-            'exercise_id': payload.get('exercise_id'),
-            'completed': bool(payload.get('completed', False)),
-            'note': payload.get('note', '')
-        }
-        if not record.get('user_id'):
-            return jsonify({'status': 'error', 'error': 'user_id required'}), 400
-        
-        services.track_progress(record)
-        return jsonify({'status': 'ok', 'record': record})
+        notes, next_cursor = services.list_hope_notes(
+            user_id,
+            limit=request.args.get('limit', 50, type=int),
+            cursor=request.args.get('cursor'),
+        )
+        return jsonify({'status': 'ok', 'notes': notes, 'next_cursor': next_cursor})
+    except storage.InvalidCursor as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
     except Exception as e:
-        ml.logger.exception('Failed to track progress')
+        ml.logger.exception('Failed to list hope notes')
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
 @bp.route('/daily_quote', methods=['GET'])
 def daily_quote():
-    q = random.choice(ml.MOTIVATIONAL_QUOTES) if ml.MOTIVATIONAL_QUOTES else "أنت تستحق لحظة لطف مع نفسك اليوم."
+    quotes = ml.content().motivational_quotes
+    q = random.choice(quotes) if quotes else "أنت تستحق لحظة لطف مع نفسك اليوم."
     return jsonify({'quote': q})
 
 @bp.route('/resources', methods=['GET'])
 def get_resources():
-    return jsonify(ml.YOUTH_RESOURCES)
+    return jsonify(ml.content().youth_resources)
 
 @bp.route('/journey', methods=['GET'])
 def get_journey_data():
-    journey_data = services.load_json_file(services.JOURNEYS_PATH, {})
-    return jsonify(journey_data)
+    return _content_response(services.JOURNEYS_PATH, {})
+
+@bp.route('/journey/progress', methods=['GET'])
+def get_journey_progress():
+    """
+    Per-journey completed/total counts and the quests still left for a user.
+    """
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'error': 'user_id required'}), 400
+
+    user = services.get_user(user_id)
+    if not user:
+        return jsonify({'status': 'error', 'error': 'user not found'}), 404
+
+    journeys = request.args.get('journey')
+    summary = services.get_quest_index().remaining(user.get('progress', {}), journeys.split(',') if journeys else None)
+    return jsonify({'status': 'ok', 'journeys': summary})
 
 @bp.route('/user/data', methods=['GET'])
 def get_user_data():
@@ -216,15 +532,16 @@ def get_user_data():
     if not user_id:
         return jsonify({'status': 'error', 'error': 'user_id required'}), 400
     
-    users = services.load_users()
-    user = users.get(user_id)
+    user = services.get_user(user_id)
     if not user:
         return jsonify({'status': 'error', 'error': 'user not found'}), 404
         
-    achievements_def = services.load_json_file(services.ACHIEVEMENTS_PATH, {})
+    achievements_def = services.load_content(services.ACHIEVEMENTS_PATH, {})
     user['achievements_details'] = [achievements_def[ach_id] for ach_id in user.get('achievements', []) if ach_id in achievements_def]
 
-    return jsonify({'status': 'ok', 'user': user})
+    resp = jsonify({'status': 'ok', 'user': user})
+    resp.add_etag()
+    return resp.make_conditional(request)
 
 @bp.route('/quest/complete', methods=['POST'])
 def complete_quest_route():
@@ -236,14 +553,13 @@ def complete_quest_route():
         if not user_id or not quest_id:
             return jsonify({'status': 'error', 'error': 'user_id and quest_id are required'}), 400
 
-        users = services.load_users()
-        user = users.get(user_id)
-        if not user:
-            return jsonify({'status': 'error', 'error': 'user not found'}), 404
+        def complete(u):
+            u = services.complete_quest(u, quest_id)
+            return u, u
 
-        user = services.complete_quest(user, quest_id)
-        
-        services.save_users(users)
+        user, found = services.update_user(user_id, complete)
+        if not found:
+            return jsonify({'status': 'error', 'error': 'user not found'}), 404
         
         # This part needs to be adjusted in the services
         new_achievement = None 
@@ -262,15 +578,14 @@ def daily_checkin():
         if not user_id:
             return jsonify({'status': 'error', 'error': 'user_id required'}), 400
         
-        users = services.load_users()
-        user = users.get(user_id)
-        if not user:
-            return jsonify({'status': 'error', 'error': 'user not found'}), 404
+        def checkin(u):
+            u, message = services.daily_checkin(u)
+            return u, (u, message)
 
-        user, message = services.daily_checkin(user)
-        
-        users[user_id] = user
-        services.save_users(users)
+        result, found = services.update_user(user_id, checkin)
+        if not found:
+            return jsonify({'status': 'error', 'error': 'user not found'}), 404
+        user, message = result
 
         return jsonify({'status': 'ok', 'message': message, 'streak': user['streak'], 'badges': user.get('badges', [])})
     except Exception as e:
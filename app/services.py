@@ -1,21 +1,58 @@
 import os
 import json
+import time
 import logging
 import datetime
+import functools
+
+from . import content_cache
+from . import interaction_log
+from . import metrics
+from . import quest_index
+from . import storage
+from . import write_behind
 
 logger = logging.getLogger(__name__)
 
-# Define file paths
-DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+# Define file paths (IMMA_DATA_DIR points the app at another data directory,
+# e.g. a scratch copy for benchmarks)
+DATA_DIR = os.environ.get('IMMA_DATA_DIR') or os.path.join(os.path.dirname(__file__), '..', 'data')
 ACHIEVEMENTS_PATH = os.path.join(DATA_DIR, 'achievements.json')
 EXERCISES_PATH = os.path.join(DATA_DIR, 'exercises.json')
 JOURNEYS_PATH = os.path.join(DATA_DIR, 'journeys.json')
 PROGRESS_PATH = os.path.join(DATA_DIR, 'progress.json')
 USERS_PATH = os.path.join(DATA_DIR, 'users.json')
 INTERACTION_LOG_PATH = os.path.join(DATA_DIR, 'interaction_log.json')
+INTERACTION_LOG_DIR = os.path.join(DATA_DIR, 'interaction_log')
+DB_PATH = os.path.join(DATA_DIR, 'imma.db')
 RESPONSES_PATH = os.path.join(DATA_DIR, 'responses.json')
 HOPE_JAR_PATH = os.path.join(DATA_DIR, 'hope_jar.json')
 
+# Write-behind settings (see write_behind.py) for the interaction log and
+# hope-note draw marks. IMMA_WRITE_BEHIND=0 writes on the request thread.
+# Progress records and new hope notes are small SQLite inserts and are always
+# written synchronously, so any worker can read them right away.
+WRITE_BEHIND = os.environ.get('IMMA_WRITE_BEHIND', '1') not in ('0', 'false')
+WRITE_QUEUE_SIZE = int(os.environ.get('IMMA_WRITE_QUEUE_SIZE', '10000'))
+WRITE_BATCH_SIZE = int(os.environ.get('IMMA_WRITE_BATCH_SIZE', '256'))
+WRITE_INTERVAL_MS = float(os.environ.get('IMMA_WRITE_INTERVAL_MS', '200'))
+
+
+def _timed(op):
+    """Records the call's latency (and failures) under imma_storage_*{op=...}."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                metrics.STORAGE_ERRORS.inc(op)
+                raise
+            finally:
+                metrics.STORAGE_SECONDS.observe(time.perf_counter() - start, op)
+        return wrapper
+    return decorator
 
 def load_json_file(path, default_value):
     """Helper function to read a JSON file safely."""
@@ -28,45 +65,109 @@ def load_json_file(path, default_value):
         logger.exception('Failed to load or parse JSON file: %s', path)
         return default_value
 
-def save_json_file(path, data):
-    """Helper function to write data to a JSON file."""
-    try:
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as fh:
-            json.dump(data, fh, ensure_ascii=False, indent=2)
-    except Exception:
-        logger.exception('Failed to save JSON file: %s', path)
-
 def load_responses():
     """Load responses from the JSON file."""
     return load_json_file(RESPONSES_PATH, {})
 
+# Read-only content files (exercises, journeys, achievements) are parsed once
+# per file version; see content_cache.py.
+content = content_cache.ContentCache()
+
+def content_entry(path, default):
+    """Returns the cached ContentEntry for a read-only JSON file."""
+    return content.get(path, default)
+
+def load_content(path, default):
+    """Parsed contents of a read-only JSON file. Do not mutate the result."""
+    return content.get(path, default).data
+
+def get_quest_index():
+    """QuestIndex for the current journeys.json, built once per file version."""
+    return content_entry(JOURNEYS_PATH, {}).derived('quest_index', quest_index.QuestIndex)
+
 def load_exercises_file():
-    return load_json_file(EXERCISES_PATH, [])
+    return load_content(EXERCISES_PATH, [])
+
+# users.json is imported into the database on first use.
+users_store = storage.RecordStore(DB_PATH, 'users', legacy_path=USERS_PATH)
+
+@_timed('users.get')
+def get_user(user_id):
+    return users_store.get(user_id)
+
+@_timed('users.create')
+def create_user(user_id, user):
+    users_store.put(user_id, user)
+
+@_timed('users.update')
+def update_user(user_id, fn):
+    """Applies ``fn(user) -> (user, result)`` under the store's write lock.
+
+    Returns ``(result, found)``.
+    """
+    return users_store.update(user_id, fn)
+
+# The log is created before the write queue so that, at exit, the queue is
+# drained into it before it closes (atexit runs handlers in reverse order).
+interaction_log.get_log(INTERACTION_LOG_DIR)
+write_queue = write_behind.get_queue(
+    max_size=WRITE_QUEUE_SIZE, batch_size=WRITE_BATCH_SIZE, interval=WRITE_INTERVAL_MS / 1000.0,
+)
+
+def _write(sink, item):
+    if WRITE_BEHIND:
+        write_queue.submit(sink, item)
+    else:
+        sink([item])
 
-def load_users():
-    return load_json_file(USERS_PATH, {})
+def shutdown():
+    """Drains pending writes and closes the interaction log (gunicorn worker_exit)."""
+    write_queue.close()
+    interaction_log.get_log(INTERACTION_LOG_DIR).close()
 
-def save_users(users):
-    save_json_file(USERS_PATH, users)
+@_timed('interactions.write')
+def _write_interactions(entries):
+    interaction_log.get_log(INTERACTION_LOG_DIR).append_many(entries)
 
+@_timed('interactions.save')
 def save_interaction(user_input, response_text, sentiment_label):
-    """Saves an interaction to the log file."""
+    """Queues an interaction for the JSON Lines log (see interaction_log.py)."""
     entry = {
         'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
         'input': user_input,
         'result': response_text,
         'sentiment_label': sentiment_label
     }
-    log_data = load_json_file(INTERACTION_LOG_PATH, [])
-    log_data.append(entry)
-    save_json_file(INTERACTION_LOG_PATH, log_data)
+    try:
+        _write(_write_interactions, entry)
+    except Exception:
+        logger.exception('Failed to append interaction to %s', INTERACTION_LOG_DIR)
+
+# progress.json is imported into the database on first use.
+progress_store = storage.EventStore(DB_PATH, 'progress', legacy_path=PROGRESS_PATH)
 
+@_timed('progress.write')
+def _write_progress(records):
+    progress_store.append_many(records)
+
+@_timed('progress.track')
 def track_progress(record):
-    """Saves a progress record."""
-    progress_data = load_json_file(PROGRESS_PATH, [])
-    progress_data.append(record)
-    save_json_file(PROGRESS_PATH, progress_data)
+    """Stores a progress record."""
+    _write_progress([record])
+
+@_timed('progress.query')
+def query_progress(user_id, since=None, until=None, limit=100, cursor=None):
+    """Returns ``(records, next_cursor)`` for one user, oldest first.
+    ``limit=None`` returns every matching record and no cursor."""
+    if limit is not None:
+        return progress_store.query(user_id, since=since, until=until, limit=limit, cursor=cursor)
+    records = []
+    while True:
+        page, cursor = progress_store.query(user_id, since=since, until=until,
+                                            limit=progress_store.MAX_LIMIT, cursor=cursor)
+        records.extend(page)
+        if cursor is None:
+            return records, None
 
 def award_badges_for_user(user):
     """Simple badge awarding based on streak length."""
@@ -102,36 +203,55 @@ def daily_checkin(user):
     user['last_checkin'] = datetime.datetime.utcnow().isoformat()
     return user, 'checked_in'
 
+# hope_jar.json is imported into the database on first use.
+hope_store = storage.NoteStore(DB_PATH, 'hope_notes', legacy_path=HOPE_JAR_PATH)
+# Notes drawn within this many seconds are less likely to come up again.
+HOPE_REDRAW_COOLDOWN_S = float(os.environ.get('IMMA_HOPE_REDRAW_COOLDOWN_S', '86400'))
+
+@_timed('hope.write')
+def _write_hope_notes(items):
+    hope_store.add_many(items)
+
+@_timed('hope.write_draws')
+def _write_hope_draws(draws):
+    hope_store.mark_drawn(draws)
+
+@_timed('hope.add')
 def add_hope_note(user_id, content):
     """Adds a note to the user's Hope Jar."""
-    data = load_json_file(HOPE_JAR_PATH, {})
-    if user_id not in data:
-        data[user_id] = []
-    
     note = {
         'id': str(datetime.datetime.utcnow().timestamp()),
         'content': content,
         'date': datetime.datetime.utcnow().isoformat()
     }
-    data[user_id].append(note)
-    save_json_file(HOPE_JAR_PATH, data)
+    _write_hope_notes([(user_id, note)])
     return note
 
-def get_random_hope_note(user_id):
-    """Retrieves a random note from the jar."""
-    data = load_json_file(HOPE_JAR_PATH, {})
-    user_notes = data.get(user_id, [])
-    
+@_timed('hope.draw')
+def get_random_hope_note(user_id, weighted=True):
+    """Retrieves a random note from the jar, favoring notes not drawn recently.
+
+    Draw marks are written behind, so a draw on another worker (or within
+    the write interval) may not see the latest cooldowns yet.
+    """
+    drawn = hope_store.draw(user_id, cooldown=HOPE_REDRAW_COOLDOWN_S if weighted else None)
+
     # Default notes if empty
-    if not user_notes:
+    if drawn is None:
         return {
             'content': "تذكر أنك أقوى مما تعتقد. 🌟",
             'date': datetime.datetime.utcnow().isoformat(),
             'is_default': True
         }
-    
-    import random
-    return random.choice(user_notes)
+
+    pos, note = drawn
+    _write(_write_hope_draws, (user_id, pos, time.time()))
+    return note
+
+@_timed('hope.list')
+def list_hope_notes(user_id, limit=50, cursor=None):
+    """Returns ``(notes, next_cursor)`` for one user, oldest first."""
+    return hope_store.page(user_id, limit=limit, cursor=cursor)
 
 def complete_quest(user, quest_id):
     """Handles quest completion logic."""
@@ -142,19 +262,8 @@ def complete_quest(user, quest_id):
     progress[quest_id] = True
     user['progress'] = progress
 
-    journeys = load_json_file(JOURNEYS_PATH, {})
-    quest_xp = 0
-    completed_journey_id = None
-
-    for journey_data in journeys.values():
-        for quest in journey_data.get('quests', []):
-            if quest['id'] == quest_id:
-                quest_xp = quest.get('xp', 0)
-                all_quests_in_journey = {q['id'] for q in journey_data.get('quests', [])}
-                if all_quests_in_journey.issubset(set(user['progress'].keys())):
-                    completed_journey_id = journey_data.get('id')
-                break
-    
+    quest_xp, completed_journey_id = get_quest_index().complete(quest_id, progress)
+
     user['xp'] = user.get('xp', 0) + quest_xp
 
     if completed_journey_id:
@@ -0,0 +1,109 @@
+"""Trie-based Arabic affix stripping with memoized stems.
+
+A profile is a list of steps. Each step strips one affix (or, with
+``repeat``, affixes until none applies) from a priority-ordered list, as
+long as at least ``min_stem`` characters remain. Affixes are looked up by
+walking a prefix or reversed-suffix trie, so the cost depends on the
+longest affix, not on how many affixes a profile has.
+
+Profiles:
+
+- ``simple``  the original utils.simple_stem rules (default)
+- ``light``   a Light10-style light stemmer: leading waw, definite-article
+              forms, and repeated suffix stripping
+
+Select one with ``IMMA_STEMMER_PROFILE``.
+"""
+import os
+from functools import lru_cache
+
+PROFILES = {
+    'simple': (
+        ('prefix', ("ال", "و", "ف", "ب", "ل", "ك"), 2, False),
+        ('suffix', ("ه", "ها", "ان", "ون", "ين", "ات", "ة"), 2, False),
+    ),
+    'light': (
+        ('prefix', ("و",), 3, False),
+        ('prefix', ("وال", "بال", "كال", "فال", "لل", "ال"), 2, False),
+        ('suffix', ("ها", "ان", "ات", "ون", "ين", "يه", "ية", "ه", "ة", "ي"), 2, True),
+    ),
+}
+STEM_CACHE_SIZE = 65536
+
+
+class _Trie:
+    """Affixes keyed by character from one end of the word; leaves hold (priority, length)."""
+
+    def __init__(self, affixes, reverse=False):
+        self.reverse = reverse
+        self.root = {}
+        self.depth = 0
+        for priority, affix in enumerate(affixes):
+            node = self.root
+            for ch in (reversed(affix) if reverse else affix):
+                node = node.setdefault(ch, {})
+            # The first listing of an affix keeps its priority.
+            node.setdefault(None, (priority, len(affix)))
+            self.depth = max(self.depth, len(affix))
+
+    def best(self, word, min_stem):
+        """Length of the highest-priority affix that leaves ``min_stem`` characters, or 0."""
+        node = self.root
+        best = None
+        n = len(word)
+        chars = reversed(word[-self.depth:]) if self.reverse else word[:self.depth]
+        for ch in chars:
+            node = node.get(ch)
+            if node is None:
+                break
+            hit = node.get(None)
+            if hit is not None and n - hit[1] >= min_stem and (best is None or hit[0] < best[0]):
+                best = hit
+        return best[1] if best else 0
+
+
+class Stemmer:
+    """Applies a profile's steps; ``stem`` is memoized per token."""
+
+    def __init__(self, steps, cache_size=STEM_CACHE_SIZE, name=None):
+        self.name = name
+        self.steps = [(kind == 'suffix', _Trie(affixes, reverse=(kind == 'suffix')), min_stem, repeat)
+                      for kind, affixes, min_stem, repeat in steps]
+        self.stem = lru_cache(maxsize=cache_size)(self._stem)
+
+    def _stem(self, word):
+        for is_suffix, trie, min_stem, repeat in self.steps:
+            while True:
+                length = trie.best(word, min_stem)
+                if not length:
+                    break
+                word = word[:-length] if is_suffix else word[length:]
+                if not repeat:
+                    break
+        return word
+
+    def stem_many(self, words):
+        """Stems for a batch of tokens; each distinct token is stemmed once."""
+        words = list(words)
+        stem = self.stem
+        unique = {w: stem(w) for w in dict.fromkeys(words)}
+        return [unique[w] for w in words]
+
+
+_stemmers = {}
+
+
+def get_stemmer(profile):
+    """Shared Stemmer for a profile name from PROFILES."""
+    stemmer = _stemmers.get(profile)
+    if stemmer is None:
+        if profile not in PROFILES:
+            raise ValueError('unknown stemmer profile %r (expected one of %s)' % (profile, ', '.join(PROFILES)))
+        stemmer = _stemmers.setdefault(profile, Stemmer(PROFILES[profile], name=profile))
+    return stemmer
+
+
+PROFILE = os.environ.get('IMMA_STEMMER_PROFILE', 'simple')
+STEMMER = get_stemmer(PROFILE)
+stem = STEMMER.stem
+stem_many = STEMMER.stem_many
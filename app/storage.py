@@ -0,0 +1,347 @@
+"""SQLite-backed record storage shared by all gunicorn workers.
+
+SQLite in WAL mode gives cross-process locking and atomic commits, so each
+request only reads and writes the records it touches instead of
+re-serializing a whole JSON file.
+"""
+import os
+import abc
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not returned by this store."""
+
+
+def connect(path):
+    """Opens a connection configured for concurrent multi-process access."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class SQLiteTable(abc.ABC):
+    """Base for stores backed by one SQLite table.
+
+    Per-thread connections are opened lazily by ``_conn()``; subclasses
+    create their table in ``_init_schema``, which runs once per store.
+    """
+
+    def __init__(self, path, table, legacy_path=None):
+        self.path = path
+        self.table = table
+        self.legacy_path = legacy_path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @abc.abstractmethod
+    def _init_schema(self, conn):
+        """Creates the table and indexes; runs once per store on its first connection."""
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not be shared across a fork.
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = connect(self.path)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._init_schema(conn)
+                    self._initialized = True
+        return conn
+
+
+class RecordStore(SQLiteTable):
+    """Key -> JSON document store with per-record transactional updates."""
+
+    def _init_schema(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value TEXT NOT NULL)' % self.table)
+            empty = conn.execute('SELECT 1 FROM %s LIMIT 1' % self.table).fetchone() is None
+            if empty and self.legacy_path and os.path.exists(self.legacy_path):
+                self._import_legacy(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _import_legacy(self, conn):
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as fh:
+                legacy = json.load(fh)
+        except (json.JSONDecodeError, OSError):
+            logger.exception('Failed to import legacy records from %s', self.legacy_path)
+            return
+        rows = [(k, json.dumps(v, ensure_ascii=False)) for k, v in legacy.items()]
+        conn.executemany('INSERT OR IGNORE INTO %s (key, value) VALUES (?, ?)' % self.table, rows)
+        logger.info('Imported %d records from %s', len(rows), self.legacy_path)
+
+    def get(self, key, default=None):
+        row = self._conn().execute('SELECT value FROM %s WHERE key = ?' % self.table, (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, key, value):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.table,
+            (key, json.dumps(value, ensure_ascii=False)))
+
+    def put_many(self, items):
+        conn = self._conn()
+        rows = [(k, json.dumps(v, ensure_ascii=False)) for k, v in items.items()]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.table, rows)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def update(self, key, fn):
+        """Atomically applies ``fn(value)`` to one record.
+
+        ``fn`` receives the current document and returns ``(new_value, result)``;
+        ``new_value`` is written back unless it is None. Returns ``(result, found)``.
+        The write lock is held for the whole read-modify-write, so concurrent
+        workers cannot lose each other's updates.
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM %s WHERE key = ?' % self.table, (key,)).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return None, False
+            new_value, result = fn(json.loads(row[0]))
+            if new_value is not None:
+                conn.execute('UPDATE %s SET value = ? WHERE key = ?' % self.table,
+                             (json.dumps(new_value, ensure_ascii=False), key))
+            conn.execute('COMMIT')
+            return result, True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def all(self):
+        rows = self._conn().execute('SELECT key, value FROM %s' % self.table).fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+
+class EventStore(SQLiteTable):
+    """Append-only per-user event log indexed by (user_id, timestamp).
+
+    Reads are keyset-paginated, so memory stays bounded by ``limit`` no matter
+    how many events a user or the whole table has.
+    """
+
+    MAX_LIMIT = 500
+
+    def _init_schema(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS %s (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'user_id TEXT NOT NULL, timestamp TEXT NOT NULL, value TEXT NOT NULL)' % self.table)
+            conn.execute('CREATE INDEX IF NOT EXISTS %s_user_ts ON %s (user_id, timestamp, seq)'
+                         % (self.table, self.table))
+            empty = conn.execute('SELECT 1 FROM %s LIMIT 1' % self.table).fetchone() is None
+            if empty and self.legacy_path and os.path.exists(self.legacy_path):
+                self._import_legacy(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _import_legacy(self, conn):
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as fh:
+                legacy = json.load(fh)
+        except (json.JSONDecodeError, OSError):
+            logger.exception('Failed to import legacy events from %s', self.legacy_path)
+            return
+        rows = [self._row(r) for r in legacy if r.get('user_id')]
+        conn.executemany('INSERT INTO %s (user_id, timestamp, value) VALUES (?, ?, ?)' % self.table, rows)
+        logger.info('Imported %d events from %s', len(rows), self.legacy_path)
+
+    @staticmethod
+    def _row(record):
+        return (record['user_id'], record.get('timestamp') or '', json.dumps(record, ensure_ascii=False))
+
+    def append(self, record):
+        self._conn().execute(
+            'INSERT INTO %s (user_id, timestamp, value) VALUES (?, ?, ?)' % self.table, self._row(record))
+
+    def append_many(self, records):
+        """Inserts records in one transaction."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT INTO %s (user_id, timestamp, value) VALUES (?, ?, ?)' % self.table,
+                             [self._row(r) for r in records])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def query(self, user_id, since=None, until=None, limit=100, cursor=None):
+        """Returns ``(records, next_cursor)`` for one user, oldest first.
+
+        ``since`` is inclusive and ``until`` exclusive (ISO timestamps).
+        ``cursor`` is the opaque ``next_cursor`` of a previous page.
+        """
+        limit = max(1, min(int(limit), self.MAX_LIMIT))
+        sql = 'SELECT seq, timestamp, value FROM %s WHERE user_id = ?' % self.table
+        params = [user_id]
+        if since:
+            sql += ' AND timestamp >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND timestamp < ?'
+            params.append(until)
+        if cursor:
+            ts, sep, seq = cursor.rpartition('|')
+            if not sep or not seq.isdigit():
+                raise InvalidCursor('invalid cursor')
+            sql += ' AND (timestamp > ? OR (timestamp = ? AND seq > ?))'
+            params.extend([ts, ts, int(seq)])
+        sql += ' ORDER BY timestamp, seq LIMIT ?'
+        params.append(limit + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = '%s|%d' % (rows[-1][1], rows[-1][0])
+        return [json.loads(r[2]) for r in rows], next_cursor
+
+
+class NoteStore(SQLiteTable):
+    """Per-user notes with constant-time random draws.
+
+    Each user's notes get dense positions 0..n-1 and the count is kept in a
+    side table, so a draw is one count lookup plus one primary-key lookup.
+    Neither depends on how many users or notes exist.
+    """
+
+    MAX_LIMIT = 200
+
+    def _init_schema(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS %s (user_id TEXT NOT NULL, pos INTEGER NOT NULL, '
+                'value TEXT NOT NULL, draws INTEGER NOT NULL DEFAULT 0, last_drawn REAL, '
+                'PRIMARY KEY (user_id, pos))' % self.table)
+            conn.execute('CREATE TABLE IF NOT EXISTS %s_counts (user_id TEXT PRIMARY KEY, n INTEGER NOT NULL)'
+                         % self.table)
+            empty = conn.execute('SELECT 1 FROM %s LIMIT 1' % self.table).fetchone() is None
+            if empty and self.legacy_path and os.path.exists(self.legacy_path):
+                self._import_legacy(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _import_legacy(self, conn):
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as fh:
+                legacy = json.load(fh)
+        except (json.JSONDecodeError, OSError):
+            logger.exception('Failed to import legacy notes from %s', self.legacy_path)
+            return
+        self._insert(conn, [(user_id, note) for user_id, notes in legacy.items() for note in notes])
+        logger.info('Imported notes for %d users from %s', len(legacy), self.legacy_path)
+
+    def _insert(self, conn, items):
+        counts = {}
+        rows = []
+        for user_id, note in items:
+            if user_id not in counts:
+                row = conn.execute('SELECT n FROM %s_counts WHERE user_id = ?' % self.table, (user_id,)).fetchone()
+                counts[user_id] = row[0] if row else 0
+            rows.append((user_id, counts[user_id], json.dumps(note, ensure_ascii=False)))
+            counts[user_id] += 1
+        conn.executemany('INSERT INTO %s (user_id, pos, value) VALUES (?, ?, ?)' % self.table, rows)
+        conn.executemany('INSERT OR REPLACE INTO %s_counts (user_id, n) VALUES (?, ?)' % self.table,
+                         list(counts.items()))
+
+    def add_many(self, items):
+        """Appends ``(user_id, note)`` pairs in one transaction."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._insert(conn, items)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def count(self, user_id):
+        row = self._conn().execute('SELECT n FROM %s_counts WHERE user_id = ?' % self.table, (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _at(self, user_id, pos):
+        return self._conn().execute('SELECT value, last_drawn FROM %s WHERE user_id = ? AND pos = ?' % self.table,
+                                    (user_id, pos)).fetchone()
+
+    def draw(self, user_id, cooldown=None, attempts=8, rng=random):
+        """Returns ``(pos, note)`` for a random note, or None if the user has none.
+
+        With ``cooldown`` (seconds), notes drawn recently are less likely: a
+        candidate drawn ``age`` seconds ago is accepted with probability
+        ``max(0.05, age / cooldown)`` (rejection sampling, so a draw still
+        costs a constant number of lookups). Record draws with mark_drawn().
+        """
+        n = self.count(user_id)
+        if not n:
+            return None
+        now = time.time()
+        for attempt in range(attempts if cooldown else 1):
+            pos = rng.randrange(n)
+            row = self._at(user_id, pos)
+            if row is None:
+                continue
+            last_drawn = row[1]
+            if cooldown and last_drawn is not None and attempt < attempts - 1:
+                if rng.random() > max(0.05, (now - last_drawn) / cooldown):
+                    continue
+            return pos, json.loads(row[0])
+        return None
+
+    def mark_drawn(self, draws):
+        """Records ``(user_id, pos, timestamp)`` draws in one transaction."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('UPDATE %s SET draws = draws + 1, last_drawn = ? WHERE user_id = ? AND pos = ?'
+                             % self.table, [(ts, user_id, pos) for user_id, pos, ts in draws])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def page(self, user_id, limit=50, cursor=None):
+        """Returns ``(notes, next_cursor)`` in insertion order."""
+        limit = max(1, min(int(limit), self.MAX_LIMIT))
+        if cursor and not cursor.isdigit():
+            raise InvalidCursor('invalid cursor')
+        start = int(cursor) if cursor else 0
+        rows = self._conn().execute(
+            'SELECT pos, value FROM %s WHERE user_id = ? AND pos >= ? ORDER BY pos LIMIT ?' % self.table,
+            (user_id, start, limit + 1)).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1][0] + 1)
+        return [json.loads(r[1]) for r in rows], next_cursor
@@ -0,0 +1,94 @@
+"""Per-turn tokenizer cache and incremental context encoding.
+
+The client resends the whole growing chat history on every turn, so each
+turn's token ids are cached under a hash of its text. A new request only
+tokenizes turns that have not been seen before; the context is then
+assembled from cached pieces as ``[CLS] t1 [SEP] t2 [SEP] ... tN [SEP]``.
+This is the same sequence the tokenizer produces for the turns joined with
+" [SEP] ", including right-side truncation to ``max_length``.
+"""
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TokenCache:
+    """Thread-safe LRU of turn text -> token ids, capped by entries and total tokens."""
+
+    def __init__(self, tokenizer, max_entries=50000, max_tokens=5000000, max_length=512):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        self.max_length = max_length
+        self._entries = OrderedDict()
+        self._tokens = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def encode(self, text):
+        """Token ids for one turn, without special tokens."""
+        key = self._key(text)
+        with self._lock:
+            ids = self._entries.get(key)
+            if ids is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return ids
+            self.misses += 1
+        # Tokenize outside the lock; a concurrent duplicate is harmless.
+        ids = array('i', self.tokenizer(text, add_special_tokens=False, truncation=True,
+                                        max_length=self.max_length)['input_ids'])
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = ids
+                self._tokens += len(ids)
+                while self._entries and (len(self._entries) > self.max_entries or self._tokens > self.max_tokens):
+                    _, old = self._entries.popitem(last=False)
+                    self._tokens -= len(old)
+                    self.evictions += 1
+        return ids
+
+    def encode_context(self, turns):
+        """Model input ids for the turns joined by [SEP], truncated to max_length."""
+        tok = self.tokenizer
+        budget = self.max_length - 2
+        body = []
+        for i, turn in enumerate(turns):
+            if i:
+                body.append(tok.sep_token_id)
+            body.extend(self.encode(turn))
+            if len(body) >= budget:
+                break
+        return [tok.cls_token_id] + body[:budget] + [tok.sep_token_id]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'tokens': self._tokens,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+def pad_batch(sequences, pad_id):
+    """Pads id lists to the longest one; returns (input_ids, attention_mask) arrays."""
+    width = max(len(s) for s in sequences)
+    input_ids = np.full((len(sequences), width), pad_id, dtype=np.int64)
+    attention_mask = np.zeros((len(sequences), width), dtype=np.int64)
+    for row, seq in enumerate(sequences):
+        input_ids[row, :len(seq)] = seq
+        attention_mask[row, :len(seq)] = 1
+    return input_ids, attention_mask
@@ -1,25 +1,78 @@
-import re
 import unicodedata
+from functools import lru_cache
 
-def normalize_text(s):
-    """Normalizes input text for simpler matching and processing."""
+from .stemmer import get_stemmer
+
+# Harakat, Quranic marks and tatweel, removed before tokenizing.
+_DIACRITICS = [c for a, b in ((0x0610, 0x061A), (0x064B, 0x065F), (0x06D6, 0x06ED), (0x0640, 0x0640))
+               for c in range(a, b + 1)]
+
+
+class _NormalizeTable(dict):
+    """str.translate table filled lazily: characters that are neither word
+    characters nor in the Arabic block become spaces."""
+
+    def __missing__(self, code):
+        c = chr(code)
+        value = code if (c.isalnum() or c == '_' or 0x0600 <= code <= 0x06FF) else 32
+        self[code] = value
+        return value
+
+
+_STRIP = dict.fromkeys(_DIACRITICS)
+_TABLE = _NormalizeTable()
+
+NORMALIZE_CACHE_SIZE = 8192
+TOKEN_CACHE_SIZE = 65536
+_tokens = {}
+
+
+def _normalize_token(token):
+    # NFKC, diacritic removal, lower() and separator replacement, in that
+    # order: lower() maps a final sigma by its neighbours, so diacritics must
+    # be gone first. ASCII tokens skip NFKC and the strip, which cannot
+    # change them.
+    if not token.isascii():
+        token = unicodedata.normalize("NFKC", token).translate(_STRIP)
+    return " ".join(token.lower().translate(_TABLE).split())
+
+
+def _normalize(s):
+    # Whitespace always ends up as a separator, and neither NFKC nor lower()
+    # looks across it, so each whitespace-delimited token is normalized on
+    # its own and memoized (words repeat far more than messages do).
     if not s:
         return ""
-    s = unicodedata.normalize("NFKC", s)
-    s = re.sub(r"[\u0610-\u061A\u064B-\u065F\u06D6-\u06ED\u0640]", "", s)
-    s = s.lower()
-    s = re.sub(r"[^\w\u0600-\u06FF]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    cache = _tokens
+    out = []
+    for token in s.split():
+        piece = cache.get(token)
+        if piece is None:
+            piece = _normalize_token(token)
+            if len(cache) >= TOKEN_CACHE_SIZE:
+                cache.clear()
+            cache[token] = piece
+        if piece:
+            out.append(piece)
+    return " ".join(out)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_text(s):
+    """Normalizes input text for simpler matching and processing."""
+    return _normalize(s)
+
+
+def normalize_many(texts):
+    """normalize_text for bulk jobs; normalizes each distinct text once, bypassing the memo."""
+    texts = list(texts)
+    unique = {t: _normalize(t) for t in dict.fromkeys(texts)}
+    return [unique[t] for t in texts]
+
+
+_simple_stem = get_stemmer('simple').stem
+
 
 def simple_stem(word):
-    # Simple stemmer for Arabic (as in your original code)
-    for p in ("ال", "و", "ف", "ب", "ل", "ك"):
-        if word.startswith(p) and len(word) > len(p) + 1:
-            word = word[len(p):]
-            break
-    for s in ("ه", "ها", "ان", "ون", "ين", "ات", "ة"):
-        if word.endswith(s) and len(word) > len(s) + 1:
-            word = word[:-len(s)]
-            break
-    return word
+    """Strips one common Arabic prefix and one suffix (the ``simple`` stemmer profile)."""
+    return _simple_stem(word)
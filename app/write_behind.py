@@ -0,0 +1,193 @@
+"""Write-behind queue: request threads enqueue, one flusher thread writes.
+
+Each item is queued with a *sink*, a callable that persists a list of items.
+The flusher collects items until ``batch_size`` or ``interval`` is reached and
+then calls every sink once with all of its pending items, in submission order.
+So a burst of interactions becomes one log write, and a burst of progress
+records becomes one transaction.
+
+When the queue is full, ``submit`` blocks for up to ``put_timeout`` seconds
+(backpressure). If the flusher still cannot keep up, the item is written
+synchronously instead. A sink call that fails ``retries`` times in a row is
+logged and its items are dropped (counted in ``stats()['dropped']``).
+``flush()`` waits until everything queued before the call is handled, in
+this process only; use the queue only for writes that other workers do not
+need to read back immediately.
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Barrier:
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class WriteBehindQueue:
+    """Bounded queue of (sink, item) pairs drained by a background thread."""
+
+    def __init__(self, max_size=10000, batch_size=256, interval=0.2, put_timeout=5.0,
+                 retries=3, name='write-behind'):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.name = name
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.written = 0
+        self.batches = 0
+        self.blocked = 0
+        self.sync_writes = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        # Started lazily so forked gunicorn workers each get their own flusher.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_size)
+                self._pid = os.getpid()
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, sink, item):
+        """Queues ``item`` for ``sink([items])``; blocks briefly when the queue is full."""
+        if self._closed and self._pid == os.getpid():
+            self._write(sink, [item])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((sink, item))
+            return
+        except queue.Full:
+            self.blocked += 1
+        try:
+            self._queue.put((sink, item), timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning('%s queue still full after %.1fs; writing synchronously', self.name, self.put_timeout)
+            self.sync_writes += 1
+            self._write(sink, [item])
+
+    def flush(self, timeout=None):
+        """Waits until everything submitted so far is written. Returns False on timeout."""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+        barrier = _Barrier()
+        self._queue.put(barrier)
+        return barrier.done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Flushes and stops the flusher; later submits are written synchronously."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'written': self.written,
+            'batches': self.batches,
+            'blocked': self.blocked,
+            'sync_writes': self.sync_writes,
+            'dropped': self.dropped,
+        }
+
+    def _run(self):
+        q = self._queue
+        while True:
+            first = q.get()
+            batch = []
+            barriers = []
+            stop = False
+            deadline = time.monotonic() + self.interval
+            item = first
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, _Barrier):
+                    barriers.append(item)
+                else:
+                    batch.append(item)
+                if stop or barriers or len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = q.get(timeout=remaining) if remaining > 0 else q.get_nowait()
+                except queue.Empty:
+                    break
+            self._drain(batch)
+            for barrier in barriers:
+                barrier.done.set()
+            if stop:
+                # Writes that raced with close() still get persisted.
+                leftover = []
+                while True:
+                    try:
+                        item = q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _Barrier):
+                        item.done.set()
+                    elif item is not None:
+                        leftover.append(item)
+                self._drain(leftover)
+                return
+
+    def _drain(self, batch):
+        """Calls each sink once with its items, in first-submission order."""
+        if not batch:
+            return
+        groups = {}
+        for sink, item in batch:
+            groups.setdefault(sink, []).append(item)
+        for sink, items in groups.items():
+            self._write(sink, items)
+        self.batches += 1
+
+    def _write(self, sink, items):
+        for attempt in range(1, self.retries + 1):
+            try:
+                sink(items)
+                self.written += len(items)
+                return
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception('%s: dropping %d item(s) for %s', self.name, len(items),
+                                     getattr(sink, '__name__', sink))
+                    self.dropped += len(items)
+                    return
+                time.sleep(0.05 * attempt)
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_queue(**kwargs):
+    """Returns the process-wide queue, creating it on first use."""
+    global _default_queue
+    with _default_lock:
+        if _default_queue is None:
+            _default_queue = WriteBehindQueue(**kwargs)
+            atexit.register(_default_queue.close)
+        return _default_queue
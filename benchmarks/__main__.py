@@ -0,0 +1,70 @@
+"""Runs the micro and HTTP benchmark suites and saves the results as JSON.
+
+    python -m benchmarks --out bench.json              # micro + test client
+    python -m benchmarks --out bench.json --gunicorn   # plus a local gunicorn
+    python -m benchmarks --compare old.json new.json   # diff two runs
+
+Result files have sorted keys and one entry per benchmark, so they diff
+cleanly between commits.
+"""
+import sys
+import json
+import argparse
+
+from .common import scratch_data_dir, corpus, write_results, print_table
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'rps')
+
+
+def compare(old_path, new_path, out=sys.stdout):
+    with open(old_path, encoding='utf-8') as fh:
+        old = json.load(fh)
+    with open(new_path, encoding='utf-8') as fh:
+        new = json.load(fh)
+    out.write('%s (%s) -> %s (%s)\n' % (old_path, old['meta'].get('commit'), new_path, new['meta'].get('commit')))
+    out.write('%-40s' % 'benchmark' + ''.join('%18s' % m for m in METRICS) + '\n')
+    for name in sorted(set(old['results']) | set(new['results'])):
+        a, b = old['results'].get(name, {}), new['results'].get(name, {})
+        cells = []
+        for metric in METRICS:
+            if a.get(metric) and b.get(metric) is not None:
+                cells.append('%10.3f %+6.1f%%' % (b[metric], (b[metric] - a[metric]) * 100.0 / a[metric]))
+            else:
+                cells.append('%18s' % b.get(metric, '-'))
+        out.write('%-40s' % name + ''.join('%18s' % c for c in cells) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IMMA benchmark suite.')
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--corpus-size', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=3, help='micro-benchmark passes over the corpus')
+    parser.add_argument('--requests', type=int, default=300, help='requests per endpoint')
+    parser.add_argument('--gunicorn', action='store_true', help='also load a local gunicorn')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    data_dir = scratch_data_dir()
+    from . import bench_micro, bench_http
+
+    messages = corpus(args.corpus_size, args.seed)
+    results = bench_micro.run(messages, args.rounds)
+    results.update(bench_http.run_client(messages, args.requests))
+    if args.gunicorn:
+        results.update(bench_http.run_gunicorn(messages, args.requests, concurrency=args.concurrency,
+                                               workers=args.workers))
+    config = {k: v for k, v in vars(args).items() if k not in ('out', 'compare')}
+    write_results(args.out, results, config)
+    print_table(results)
+    print('Wrote %s (scratch data in %s)' % (args.out, data_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""End-to-end latency and throughput of the main endpoints.
+
+Drives create_app() through the Flask test client (in-process, sequential)
+and, with --gunicorn, a local gunicorn started from gunicorn.conf.py and
+loaded by concurrent HTTP clients. All writes go to a scratch data
+directory. Run from the repository root::
+
+    python -m benchmarks.bench_http [--gunicorn] [--requests 500] [--concurrency 16]
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import ROOT, summarize
+
+ENDPOINTS = ('/chat', '/track_progress', '/daily_checkin', '/hope/add', '/hope/shake', '/hope/notes')
+
+
+class Workload:
+    """Deterministic request generator: endpoint -> (method, path, json body)."""
+
+    def __init__(self, messages, user_ids, seed=0):
+        self.messages = messages
+        self.user_ids = user_ids
+        self.rng = random.Random(seed)
+
+    def request(self, endpoint):
+        rng = self.rng
+        user_id = rng.choice(self.user_ids)
+        if endpoint == '/chat':
+            i = rng.randrange(len(self.messages))
+            context = self.messages[max(0, i - rng.randint(0, 4)):i]
+            return 'POST', '/chat', {'message': self.messages[i], 'context': context, 'user_id': user_id}
+        if endpoint == '/track_progress':
+            return 'POST', '/track_progress', {'user_id': user_id, 'exercise_id': 'ex%d' % rng.randint(1, 20),
+                                               'completed': rng.random() < 0.7, 'note': rng.choice(self.messages)}
+        if endpoint == '/daily_checkin':
+            return 'POST', '/daily_checkin', {'user_id': user_id}
+        if endpoint == '/hope/add':
+            return 'POST', '/hope/add', {'user_id': user_id, 'content': rng.choice(self.messages)}
+        if endpoint == '/hope/shake':
+            return 'GET', '/hope/shake?user_id=%s' % user_id, None
+        if endpoint == '/hope/notes':
+            return 'GET', '/hope/notes?user_id=%s&limit=20' % user_id, None
+        raise ValueError(endpoint)
+
+
+def run_client(messages, n_requests=300, n_users=50, endpoints=ENDPOINTS):
+    """Sequential requests through the Flask test client; measures server-side cost."""
+    from app import create_app
+
+    client = create_app().test_client()
+    user_ids = [client.post('/user/create', json={'username': 'bench%d' % i}).get_json()['user_id']
+                for i in range(n_users)]
+    workload = Workload(messages, user_ids)
+    results = {}
+    for endpoint in endpoints:
+        samples, errors = [], 0
+        start_all = time.perf_counter()
+        for _ in range(n_requests):
+            method, path, body = workload.request(endpoint)
+            start = time.perf_counter()
+            resp = client.open(path, method=method, json=body)
+            samples.append(time.perf_counter() - start)
+            errors += resp.status_code >= 400
+        results['client.%s' % endpoint] = summarize(samples, time.perf_counter() - start_all, errors)
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _call(port, method, path, body):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        conn.request(method, path, body=payload, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        return resp.status, data
+    finally:
+        conn.close()
+
+
+def _start_gunicorn(port, workers):
+    env = dict(os.environ)
+    # The benchmark measures the app itself; no shared model server.
+    env.pop('IMMA_MODEL_SOCKET', None)
+    cmd = [sys.executable, '-m', 'gunicorn', 'run:app', '-c', 'gunicorn.conf.py',
+           '--bind', '127.0.0.1:%d' % port, '--workers', str(workers)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('gunicorn exited with %s' % proc.returncode)
+        try:
+            if _call(port, 'GET', '/health/ready', None)[0] == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError('gunicorn did not become ready')
+
+
+def run_gunicorn(messages, n_requests=500, n_users=50, concurrency=16, workers=3, endpoints=ENDPOINTS):
+    """Concurrent HTTP load against a local gunicorn; measures client-observed latency."""
+    port = _free_port()
+    proc = _start_gunicorn(port, workers)
+    try:
+        user_ids = []
+        for i in range(n_users):
+            status, data = _call(port, 'POST', '/user/create', {'username': 'bench%d' % i})
+            user_ids.append(json.loads(data)['user_id'])
+        workload = Workload(messages, user_ids)
+        results = {}
+        for endpoint in endpoints:
+            requests = [workload.request(endpoint) for _ in range(n_requests)]
+
+            def timed(req):
+                start = time.perf_counter()
+                try:
+                    status = _call(port, *req)[0]
+                except OSError:
+                    status = 599
+                return time.perf_counter() - start, status
+
+            start_all = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                outcomes = list(pool.map(timed, requests))
+            elapsed = time.perf_counter() - start_all
+            results['gunicorn.%s' % endpoint] = summarize(
+                [d for d, _ in outcomes], elapsed, sum(s >= 400 for _, s in outcomes))
+        return results
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main(argv=None):
+    from .common import scratch_data_dir, corpus, print_table
+
+    parser = argparse.ArgumentParser(description='HTTP endpoint benchmarks.')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--gunicorn', action='store_true')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    scratch_data_dir()
+    messages = corpus()
+    results = run_client(messages, args.requests)
+    if args.gunicorn:
+        results.update(run_gunicorn(messages, args.requests, concurrency=args.concurrency, workers=args.workers))
+    print_table(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Keyword matching cost as keyword lists grow.
+
+Compares the old per-list ``any(k in text ...)`` scans against one
+KeywordMatcher scan. Run from the repository root::
+
+    python -m benchmarks.bench_keywords
+"""
+import random
+import timeit
+
+from app import matcher
+
+MESSAGES = [
+    "انا متوتر جدا من الامتحان ومديري في الشغل يضغط علي",
+    "أشعر بالوحدة بعد طلاقي ولا اعرف ماذا افعل",
+    "مرحبا من انت وماذا تفعل",
+    "الناس أصبحوا منافقين جداً وانا تعبت",
+]
+ALPHABET = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+
+
+def synthetic_groups(total, n_groups=10, seed=0):
+    rng = random.Random(seed)
+    groups = {}
+    for i in range(total):
+        word = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(3, 8)))
+        groups.setdefault(i % n_groups, []).append(word)
+    return groups
+
+
+def bench(total, repeat=200):
+    groups = synthetic_groups(total)
+    automaton = matcher.KeywordMatcher(groups, cache_size=0)
+
+    def naive():
+        for text in MESSAGES:
+            for keywords in groups.values():
+                any(k in text for k in keywords)
+
+    def compiled():
+        for text in MESSAGES:
+            automaton.scan(text)
+
+    per_message = 1e6 / (repeat * len(MESSAGES))
+    return (min(timeit.repeat(naive, number=repeat, repeat=3)) * per_message,
+            min(timeit.repeat(compiled, number=repeat, repeat=3)) * per_message)
+
+
+def main():
+    print("%10s %14s %14s" % ("keywords", "naive us/msg", "matcher us/msg"))
+    for total in (10, 100, 1000, 5000, 20000):
+        naive, compiled = bench(total)
+        print("%10d %14.1f %14.1f" % (total, naive, compiled))
+
+
+if __name__ == "__main__":
+    main()
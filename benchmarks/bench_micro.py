@@ -0,0 +1,52 @@
+"""Per-call cost of the text pipeline stages.
+
+Times normalize_text, fallback_sentiment, _handle_phrase_bank and
+generate_response over the synthetic corpus. Run from the repository root::
+
+    python -m benchmarks.bench_micro
+"""
+import time
+import random
+
+
+def _time_each(fn, inputs, rounds):
+    samples = []
+    for _ in range(rounds):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run(messages, rounds=3):
+    from app import ml, utils
+    from .common import summarize
+
+    analyzer = ml.AdvancedSentimentAnalyzer(model_name=None)
+    normalized = [utils.normalize_text(m) for m in messages]
+    labels = [(analyzer.fallback_sentiment(m), analyzer.check_for_risk(m)) for m in messages]
+    random.seed(0)
+
+    def respond(i):
+        sentiment, risk = labels[i]
+        return analyzer.generate_response(sentiment, risk, user_input=messages[i])
+
+    cases = {
+        'micro.normalize_text': (utils.normalize_text, messages),
+        'micro.fallback_sentiment': (analyzer.fallback_sentiment, messages),
+        'micro.handle_phrase_bank': (lambda text: analyzer._handle_phrase_bank(text, ml.content()), normalized),
+        'micro.generate_response': (respond, range(len(messages))),
+    }
+    return {name: summarize(_time_each(fn, inputs, rounds)) for name, (fn, inputs) in cases.items()}
+
+
+def main():
+    from .common import scratch_data_dir, corpus, print_table
+
+    scratch_data_dir()
+    print_table(run(corpus()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""normalize_text throughput against the original regex implementation.
+
+Checks byte-identical output on a golden corpus first: every code point on
+its own and between Arabic letters and spaces, random mixes of Arabic,
+Latin, presentation forms, diacritics and punctuation, and the interaction
+log. Then times both. Run from the repository root::
+
+    python -m benchmarks.bench_normalize
+"""
+import re
+import sys
+import time
+import random
+import unicodedata
+
+from app import utils
+
+
+def reference(s):
+    """utils.normalize_text as originally written (NFKC + four regex passes)."""
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKC", s)
+    s = re.sub(r"[ؐ-ًؚ-ٟۖ-ۭـ]", "", s)
+    s = s.lower()
+    s = re.sub(r"[^\w؀-ۿ]+", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+def golden_corpus(n_random=50000, seed=0):
+    from .common import corpus
+
+    rng = random.Random(seed)
+    code_points = [chr(c) for c in range(0x110000) if not 0xD800 <= c <= 0xDFFF]
+    texts = []
+    for c in code_points:
+        texts.extend((c, 'ب' + c + ' ' + c + 'ت'))
+    pool = (code_points[:0x700] + list(' \t\n!?.,،؟ـًٌٍَُِّْ') * 20 + code_points[0xFB50:0xFEFF]
+            + list('ΑΣσςİI'))
+    texts += [''.join(rng.choice(pool) for _ in range(rng.randint(0, 40))) for _ in range(n_random)]
+    texts += corpus(5000, seed)
+    # lower() picks final sigma by its neighbours, so diacritics must go first.
+    texts += ['a۞Σ؍', 'aΣ۞b', 'xΣً', 'ًΣx', 'aـΣ b']
+    return texts
+
+
+def main():
+    from .common import corpus
+
+    texts = golden_corpus()
+    mismatches = [t for t in texts if utils._normalize(t) != reference(t)]
+    print('golden corpus: %d texts, %d mismatches' % (len(texts), len(mismatches)))
+    for t in mismatches[:5]:
+        print('  %r: %r != %r' % (t, utils._normalize(t), reference(t)))
+
+    messages = corpus(20000)
+    timings = {}
+    for name, fn in (('reference', lambda: [reference(m) for m in messages]),
+                     ('normalize (cold memo)', lambda: [utils._normalize(m) for m in messages]),
+                     ('normalize_many', lambda: utils.normalize_many(messages)),
+                     ('normalize_text (warm)', lambda: [utils.normalize_text(m) for m in messages])):
+        utils._tokens.clear()
+        if name.endswith('(warm)'):
+            fn()
+        start = time.perf_counter()
+        fn()
+        timings[name] = (time.perf_counter() - start) * 1e6 / len(messages)
+    base = timings['reference']
+    for name, us in timings.items():
+        print('%-24s %8.2f us/msg %6.1fx' % (name, us, base / us))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Phrase-bank lookup cost as the bank grows.
+
+Builds synthetic banks from responses.json vocabulary, checks that
+PhraseIndex returns exactly what difflib.get_close_matches returns, and
+times both. Run from the repository root::
+
+    python -m benchmarks.bench_phrase_bank
+"""
+import difflib
+import random
+import time
+
+from app import fuzzy
+from app import services
+from app import utils
+
+
+def vocabulary():
+    words = []
+
+    def walk(node):
+        if isinstance(node, str):
+            words.extend(utils.normalize_text(node).split())
+        elif isinstance(node, dict):
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(services.load_responses())
+    return words
+
+
+def main(sizes=(1000, 10000, 50000), n_queries=50, seed=0):
+    rng = random.Random(seed)
+    words = vocabulary()
+    print("%8s %12s %12s %8s" % ("keys", "difflib ms", "index ms", "equal"))
+    for size in sizes:
+        keys = list({" ".join(rng.choice(words) for _ in range(rng.randint(1, 3))) for _ in range(size)})
+        queries = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 6))) for _ in range(n_queries)]
+        queries += [rng.choice(keys) + " " + rng.choice(words) for _ in range(n_queries)]
+        index = fuzzy.PhraseIndex(keys)
+
+        start = time.perf_counter()
+        expected = [(difflib.get_close_matches(q, keys, n=1, cutoff=0.6) or [None])[0] for q in queries]
+        naive_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        got = [index.best(q) for q in queries]
+        index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        print("%8d %12.2f %12.2f %8s" % (len(keys), naive_ms, index_ms, got == expected))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Stemmer throughput against the original simple_stem loop.
+
+Checks that the ``simple`` profile matches the original rules on every
+token of the corpus and on every short string over the affix letters,
+then times both. Run from the repository root::
+
+    python -m benchmarks.bench_stem
+"""
+import sys
+import time
+import itertools
+
+from app import stemmer, utils
+
+
+def reference(word):
+    """utils.simple_stem as originally written."""
+    for p in ("ال", "و", "ف", "ب", "ل", "ك"):
+        if word.startswith(p) and len(word) > len(p) + 1:
+            word = word[len(p):]
+            break
+    for s in ("ه", "ها", "ان", "ون", "ين", "ات", "ة"):
+        if word.endswith(s) and len(word) > len(s) + 1:
+            word = word[:-len(s)]
+            break
+    return word
+
+
+def golden_tokens(seed=0):
+    from .common import corpus
+
+    letters = 'الوفبكهنيتةدم'
+    tokens = [''.join(t) for n in range(7) for t in itertools.product(letters, repeat=n)]
+    tokens += [w for text in utils.normalize_many(corpus(20000, seed)) for w in text.split()]
+    return tokens
+
+
+def main():
+    tokens = golden_tokens()
+    simple = stemmer.get_stemmer('simple')
+    mismatches = [t for t in tokens if simple._stem(t) != reference(t)]
+    print('golden tokens: %d, %d mismatches' % (len(tokens), len(mismatches)))
+    for t in mismatches[:5]:
+        print('  %r: %r != %r' % (t, simple._stem(t), reference(t)))
+
+    from .common import corpus
+
+    words = [w for text in utils.normalize_many(corpus(20000)) for w in text.split()]
+    timings = {}
+    for name, fn in (('reference', lambda: [reference(w) for w in words]),
+                     ('trie (no memo)', lambda: [simple._stem(w) for w in words]),
+                     ('stem (warm)', lambda: [simple.stem(w) for w in words]),
+                     ('stem_many', lambda: simple.stem_many(words))):
+        simple.stem.cache_clear()
+        if name.endswith('(warm)'):
+            fn()
+        start = time.perf_counter()
+        fn()
+        timings[name] = (time.perf_counter() - start) * 1e9 / len(words)
+    base = timings['reference']
+    for name, ns in timings.items():
+        print('%-16s %8.1f ns/token %6.1fx' % (name, ns, base / ns))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Shared helpers: scratch data directory, synthetic corpus, stats and results files."""
+import os
+import sys
+import json
+import time
+import glob
+import random
+import shutil
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DATA_DIR = os.path.join(ROOT, 'data')
+
+
+def scratch_data_dir():
+    """Copies the JSON content files to a temp dir and points IMMA_DATA_DIR at it.
+
+    Must run before ``app`` is imported, so benchmark writes never touch data/.
+    """
+    path = tempfile.mkdtemp(prefix='imma-bench-')
+    for src in glob.glob(os.path.join(SOURCE_DATA_DIR, '*.json')):
+        shutil.copy(src, path)
+    os.environ['IMMA_DATA_DIR'] = path
+    return path
+
+
+def _strings(node, out):
+    if isinstance(node, str):
+        out.append(node)
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            out.append(key)
+            _strings(value, out)
+    elif isinstance(node, list):
+        for value in node:
+            _strings(value, out)
+    return out
+
+
+def corpus(size=2000, seed=0):
+    """Synthetic Arabic messages seeded from responses.json and the interaction log.
+
+    Logged inputs are used as is. The rest are 1-12 word mixes of words from
+    responses.json (phrase-bank keys, greetings, emotion and topic texts), so
+    every handler in generate_response gets exercised.
+    """
+    from app import services, interaction_log
+
+    rng = random.Random(seed)
+    logged = [e.get('input') for e in interaction_log.iter_entries(services.INTERACTION_LOG_DIR,
+                                                                  services.INTERACTION_LOG_PATH)]
+    logged = [t for t in logged if t]
+    responses = services.load_responses()
+    words = [w for s in _strings(responses, []) for w in s.split() if len(w) > 1 and '<' not in w]
+    phrases = list(responses.get('phrase_bank', {})) + list(responses.get('greetings', {}))
+    messages = list(logged[:size // 4])
+    while len(messages) < size:
+        kind = rng.random()
+        if kind < 0.2 and phrases:
+            messages.append(rng.choice(phrases))
+        else:
+            messages.append(' '.join(rng.choice(words) for _ in range(rng.randint(1, 12))))
+    rng.shuffle(messages)
+    return messages
+
+
+def summarize(samples_s, elapsed_s=None, errors=0):
+    """Latency percentiles (ms) and throughput for per-call durations in seconds."""
+    samples = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    if not samples.size:
+        return {'n': 0, 'errors': errors}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    total = elapsed_s if elapsed_s is not None else samples.sum() / 1000.0
+    return {
+        'n': int(samples.size),
+        'errors': errors,
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'mean_ms': round(float(samples.mean()), 4),
+        'rps': round(samples.size / total, 1) if total else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path, results, config):
+    """Writes ``{"meta": ..., "results": {name: stats}}`` with sorted keys for clean diffs."""
+    doc = {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'config': config,
+        },
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(doc, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def print_table(results, out=sys.stdout):
+    out.write('%-40s %8s %10s %10s %10s %10s\n' % ('benchmark', 'n', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s'))
+    for name in sorted(results):
+        r = results[name]
+        if not r.get('n'):
+            out.write('%-40s %8s\n' % (name, 'skipped' if 'skipped' in r else 0))
+            continue
+        out.write('%-40s %8d %10.3f %10.3f %10.3f %10s\n' % (
+            name, r['n'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['rps']))
@@ -0,0 +1,55 @@
+"""gunicorn settings and server hooks."""
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import subprocess
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "5000")
+workers = 3
+threads = 8
+
+_model_server = None
+_metrics_dir_created = None
+
+
+def on_starting(server):
+    """Prepares the shared metrics directory and starts the shared model
+    server before any worker is forked."""
+    global _model_server, _metrics_dir_created
+    # Workers inherit IMMA_METRICS_DIR and aggregate /metrics through it.
+    metrics_dir = os.environ.get("IMMA_METRICS_DIR")
+    if metrics_dir:
+        for pattern in ("*.json", "*.lock"):
+            for stale in glob.glob(os.path.join(metrics_dir, pattern)):
+                os.remove(stale)
+    else:
+        _metrics_dir_created = os.environ["IMMA_METRICS_DIR"] = tempfile.mkdtemp(prefix="imma-metrics-")
+    socket_path = os.environ.get("IMMA_MODEL_SOCKET")
+    if socket_path:
+        _model_server = subprocess.Popen(
+            [sys.executable, "-m", "app.model_server", "--socket", socket_path, "--supervise"]
+        )
+        server.log.info("Started model server supervisor (pid %s) on %s", _model_server.pid, socket_path)
+
+
+def worker_exit(server, worker):
+    """Flushes the worker's write-behind queue and stops its audio pool before it exits."""
+    services = sys.modules.get("app.services")
+    if services is not None:
+        services.shutdown()
+    audio = sys.modules.get("app.audio")
+    if audio is not None:
+        audio.shutdown()
+
+
+def on_exit(server):
+    if _metrics_dir_created:
+        shutil.rmtree(_metrics_dir_created, ignore_errors=True)
+    if _model_server is not None and _model_server.poll() is None:
+        _model_server.terminate()
+        try:
+            _model_server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _model_server.kill()
@@ -558,7 +558,12 @@ document.addEventListener('DOMContentLoaded', () => {
         chatBox.appendChild(messageDiv);
         chatBox.scrollTop = chatBox.scrollHeight;
 
-        // Button Listeners
+        bindChatButtons(contentDiv);
+        return contentDiv;
+    }
+
+    // Button Listeners
+    function bindChatButtons(contentDiv) {
         contentDiv.querySelectorAll('.chat-btn').forEach(btn => {
             btn.addEventListener('click', () => {
                 const text = btn.getAttribute('data-input');
@@ -815,22 +820,115 @@ document.addEventListener('DOMContentLoaded', () => {
         chatBox.appendChild(loadingDiv);
         chatBox.scrollTop = chatBox.scrollHeight;
 
+        const payload = JSON.stringify({
+            message: text,
+            context: chatHistory.slice(0, -1),
+            user_id: userId,
+            active_topic: currentTopic // Send current topic for context
+        });
+
+        // Fall back to /chat only when the stream request itself failed; the
+        // server has not handled the message then, so it is not sent twice.
+        let response;
+        try {
+            response = await fetch('/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: payload
+            });
+        } catch (networkError) {
+            console.error(networkError);
+            await sendMessageOnce(payload, loadingId);
+            return;
+        }
+        if (!response.ok || !response.body) {
+            await sendMessageOnce(payload, loadingId);
+            return;
+        }
+
+        let contentDiv = null;
+        try {
+            // Render segments as they arrive instead of waiting for the whole reply.
+            let shown = '';
+            let data = null;
+            await readEventStream(response, (event, payload) => {
+                if (event === 'meta') {
+                    if (payload.sentiment_label) updateAtmosphere(payload.sentiment_label);
+                } else if (event === 'segment') {
+                    shown = shown ? shown + ' ' + payload.text : payload.text;
+                    if (!contentDiv) {
+                        document.getElementById(loadingId).remove();
+                        contentDiv = addMessage(shown, 'bot');
+                    } else {
+                        contentDiv.innerHTML = shown;
+                        bindChatButtons(contentDiv);
+                        chatBox.scrollTop = chatBox.scrollHeight;
+                    }
+                } else if (event === 'done' || event === 'error') {
+                    data = payload;
+                }
+            });
+
+            if (!data) throw new Error('stream ended early');
+            if (!contentDiv) {
+                document.getElementById(loadingId).remove();
+                addMessage(data.response, 'bot');
+            }
+            chatHistory.push(data.response);
+
+            // Update current topic if changed
+            if (data.active_topic) {
+                currentTopic = data.active_topic;
+            }
+        } catch (streamError) {
+            // The stream was accepted, so the server may already have logged
+            // this turn; retrying would record it twice. Keep any partial reply.
+            console.error(streamError);
+            if (!contentDiv) {
+                const loading = document.getElementById(loadingId);
+                if (loading) loading.remove();
+                addMessage("عذراً، حدث خطأ في الاتصال. 😔", 'bot');
+            }
+        }
+    }
+
+    // Calls onEvent(event, data) for each Server-Sent Event in a fetch response.
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let dataLines = [];
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+
+    async function sendMessageOnce(payload, loadingId) {
+        const loadingDiv = document.getElementById(loadingId);
         try {
             const response = await fetch('/chat', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    message: text,
-                    context: chatHistory.slice(0, -1),
-                    user_id: userId,
-                    active_topic: currentTopic // Send current topic for context
-                })
+                body: payload
             });
             
             const data = await response.json();
             
             // Remove loading
-            document.getElementById(loadingId).remove();
+            if (loadingDiv) loadingDiv.remove();
             
             addMessage(data.response, 'bot');
             chatHistory.push(data.response);
@@ -846,7 +944,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }
             
         } catch (error) {
-            document.getElementById(loadingId).remove();
+            if (loadingDiv) loadingDiv.remove();
             addMessage("عذراً، حدث خطأ في الاتصال. 😔", 'bot');
             console.error(error);
         }
@@ -1055,11 +1153,20 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!userId) return;
         
         try {
-            const res = await fetch(`/progress?user_id=${userId}`);
-            const data = await res.json();
+            // Follow next_cursor so users with long histories still see their latest activity.
+            const records = [];
+            let cursor = null;
+            do {
+                let url = `/progress?user_id=${encodeURIComponent(userId)}&limit=500`;
+                if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+                const res = await fetch(url);
+                const data = await res.json();
+                records.push(...(data.records || []));
+                cursor = data.next_cursor;
+            } while (cursor);
             list.innerHTML = '';
-            if (data.records && data.records.length > 0) {
-                data.records.reverse().forEach(rec => {
+            if (records.length > 0) {
+                records.reverse().forEach(rec => {
                     const li = document.createElement('li');
                     li.innerHTML = `
                         <strong>${new Date(rec.timestamp).toLocaleDateString('ar')}</strong>: 